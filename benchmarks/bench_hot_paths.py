@@ -0,0 +1,424 @@
+"""
+Микробенчмарки горячих путей бота со сравнением с базовой линией.
+
+Покрыто:
+- разбор напоминаний (parse_delay / parse_reminder) на обычном тексте и на напоминаниях
+- build_prompt (сборка и кеш по версии профиля), format_chat_history (подбор истории под бюджет токенов)
+- safe_load_json и async_save_json (с дозаписью на диск) на файлах разного размера
+- _get_user_reminders (индекс реестра) при большом числе напоминаний
+- постановка в расписание больших пачек: ReminderRegistry.add с пробуждением
+  планировщика и перенос в ближнюю кучу HorizonScheduler._pull
+  (прежний schedule_reminder заменён ими)
+
+Быстрые операции гоняются в цикле (число повторов подбирается до --min-time),
+тяжёлые — по одному вызову с подготовкой вне замера. Берётся минимум
+из --repeat прогонов. Результаты (нс на операцию) пишутся в JSON и
+сравниваются с базовой линией: замедление больше --threshold — регрессия,
+код выхода 1.
+
+Времена в baseline.json абсолютные и годятся только для машины, где их
+сняли (она записана в поле machine). Перед сравнением базовую линию
+нужно снять у себя (--save-baseline) на неизменённом коде. Если машина
+в базовой линии другая, сравнение только печатается и прогон не падает.
+Порог по умолчанию (100%, т.е. замедление вдвое) с запасом на шум общих
+виртуалок: на одном ядре повторный прогон того же кода расходится до x1.9.
+Для точного сравнения поднимите --repeat и задайте порог меньше.
+
+Запуск (из корня репозитория):
+    python benchmarks/bench_hot_paths.py
+    python benchmarks/bench_hot_paths.py --quick -k parse
+    python benchmarks/bench_hot_paths.py --json out.json --threshold 0.3 --repeat 15
+    python benchmarks/bench_hot_paths.py --save-baseline
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from statistics import median
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(ROOT.parent / "bot"))
+
+BASELINE = ROOT / "baseline.json"
+
+# Временные файлы бенчмарков (все файловые пути — внутри)
+TMP = Path(tempfile.mkdtemp(prefix="bench_hot_paths_"))
+
+# Один цикл событий на все асинхронные замеры: JsonWriter привязан к циклу
+LOOP = asyncio.new_event_loop()
+
+
+@dataclass
+class Case:
+    """
+    Замер: make() готовит данные и возвращает операцию.
+    batch — операция быстрая, гоняется в цикле; иначе перед каждым
+    вызовом выполняется reset() (вне замера). slow — пропускается в --quick.
+    """
+    name: str
+    make: Callable[[], Callable[[], Any]]
+    is_async: bool = False
+    batch: bool = True
+    reset: Optional[Callable[[], None]] = None
+    slow: bool = False
+    ops: int = 1  # операций за вызов (для пачек — размер пачки)
+
+
+def _profiles(n: int) -> Dict[str, dict]:
+    rnd = random.Random(n)
+    return {
+        str(100000 + i): {
+            "language": rnd.choice(("RU", "EN")),
+            "style": rnd.choice(("street", "coach", "psych")),
+            "gender": rnd.choice(("male", "female", "")),
+            "name": f"user{i}",
+            "persona": {"hobby": ["музыка", "спорт"], "job": "разработчик"},
+        }
+        for i in range(n)
+    }
+
+
+def _reminders(n: int, users: int) -> List["Reminder"]:
+    from services.reminder_store import Reminder
+
+    rnd = random.Random(n)
+    now = datetime.now(timezone.utc)
+    return [
+        Reminder(
+            id=str(uuid.UUID(int=rnd.getrandbits(128))),
+            uid=rnd.randrange(users),
+            at=now + timedelta(seconds=rnd.randrange(1, 30 * 86400)),
+            msg="купить хлеб",
+        )
+        for _ in range(n)
+    ]
+
+
+def _journal_backend(name: str):
+    from services.reminder_store import JournalBackend
+
+    directory = TMP / name
+    directory.mkdir(exist_ok=True)
+    for path in directory.iterdir():
+        path.unlink()
+    return JournalBackend(directory / "reminders.json", directory / "reminders.journal")
+
+
+# --- разбор напоминаний ---
+
+def _parse(text: str, fn: str = "parse_delay"):
+    def make():
+        import utils.parse_reminder as parser
+
+        parse = getattr(parser, fn)
+        return lambda: parse(text, "RU")
+    return make
+
+
+# --- prompt и история ---
+
+def _build_prompt():
+    from services.openai_service import build_prompt
+
+    user = _profiles(1)["100000"]
+    return lambda: build_prompt(user)
+
+
+def _get_prompt():
+    from services.openai_service import get_prompt
+
+    user = _profiles(1)["100000"]
+    return lambda: get_prompt(100000, user)
+
+
+def _format_history(n: int):
+    def make():
+        from services.openai_service import format_chat_history
+
+        history = [{"role": "user" if i % 2 else "assistant", "content": f"сообщение {i}"} for i in range(n)]
+        return lambda: format_chat_history(history, "prompt")
+    return make
+
+
+# --- JSON ---
+
+def _safe_load(n: int):
+    def make():
+        from utils.json_utils import _write_atomic, safe_load_json
+
+        path = str(TMP / f"profiles_{n}.json")
+        _write_atomic(path, _profiles(n))
+        return lambda: safe_load_json(path, {})
+    return make
+
+
+def _async_save(n: int):
+    def make():
+        from utils.json_utils import async_save_json, flush_pending_json
+
+        path = str(TMP / f"saved_{n}.json")
+        data = _profiles(n)
+
+        async def op():
+            await async_save_json(path, data)
+            await flush_pending_json()
+        return op
+    return make
+
+
+# --- напоминания ---
+
+def _user_reminders(n: int, users: int):
+    def make():
+        from handlers.reminders import _get_user_reminders
+        from services.reminder_store import ReminderRegistry
+
+        backend = _journal_backend(f"user_reminders_{n}")
+        LOOP.run_until_complete(backend.save_all(_reminders(n, users)))
+        registry = ReminderRegistry(backend)
+        registry.reload()
+        context = SimpleNamespace(application=SimpleNamespace(bot_data={"reminder_registry": registry}))
+        uids = itertools.cycle(range(users))
+        return lambda: _get_user_reminders(context, next(uids))
+    return make
+
+
+class _Schedule:
+    """Состояние замеров постановки в расписание (пересоздаётся в reset)."""
+
+    def __init__(self, n: int) -> None:
+        self.n = n
+        self.reminders = None
+        self.registry = None
+        self.engine = None
+        self.backend = None
+
+    def _fresh(self, load: bool) -> None:
+        from services.reminder_engine import HorizonScheduler
+        from services.reminder_store import ReminderRegistry
+
+        if self.reminders is None:
+            self.reminders = _reminders(self.n, users=max(1, self.n // 10))
+        if self.backend is not None:
+            # Дожидаемся фонового сжатия журнала, прежде чем стирать его файлы
+            if self.backend._compaction is not None:
+                LOOP.run_until_complete(self.backend._compaction)
+            self.backend._journal.close()
+        self.backend = _journal_backend(f"schedule_{self.n}")
+        if load:
+            LOOP.run_until_complete(self.backend.save_all(self.reminders))
+        self.registry = ReminderRegistry(self.backend)
+        self.registry.reload()
+
+        async def fire(reminder):
+            pass
+
+        # Горизонт покрывает всю пачку: _pull переносит её целиком
+        self.engine = HorizonScheduler(self.registry, fire, horizon=31 * 86400)
+        self.registry.on_add = lambda reminder: self.engine.wake()
+
+    def reset_add(self) -> None:
+        self._fresh(load=False)
+
+    def reset_pull(self) -> None:
+        self._fresh(load=True)
+
+    async def add(self) -> None:
+        for r in self.reminders:
+            await self.registry.add(r)
+
+    def pull(self) -> None:
+        self.engine._pull(time.time())
+
+
+def _schedule_cases(n: int, slow: bool) -> List[Case]:
+    state = _Schedule(n)
+    return [
+        Case(f"schedule/add_{n}", lambda: state.add, is_async=True, batch=False,
+             reset=state.reset_add, slow=slow, ops=n),
+        Case(f"schedule/pull_{n}", lambda: state.pull, batch=False,
+             reset=state.reset_pull, slow=slow, ops=n),
+    ]
+
+
+def cases() -> List[Case]:
+    return [
+        Case("parse_delay/chat", _parse("привет, как дела?")),
+        Case("parse_delay/chat_lead_word", _parse("через дорогу открыли кафе")),
+        Case("parse_delay/relative", _parse("через 2 часа позвонить маме")),
+        Case("parse_delay/absolute", _parse("завтра в 9 зарядка")),
+        Case("parse_reminder/recurring", _parse("каждый понедельник в 9:30 планёрка", "parse_reminder")),
+        Case("build_prompt", _build_prompt),
+        Case("get_prompt/cached", _get_prompt),
+        Case("format_chat_history/200", _format_history(200)),
+        Case("safe_load_json/100", _safe_load(100)),
+        Case("safe_load_json/10000", _safe_load(10_000)),
+        Case("safe_load_json/100000", _safe_load(100_000), slow=True),
+        Case("async_save_json/100", _async_save(100), is_async=True),
+        Case("async_save_json/10000", _async_save(10_000), is_async=True),
+        Case("async_save_json/100000", _async_save(100_000), is_async=True, slow=True),
+        Case("get_user_reminders/100000", _user_reminders(100_000, users=1000), slow=True),
+        Case("get_user_reminders/10000", _user_reminders(10_000, users=100)),
+        *_schedule_cases(10_000, slow=False),
+        *_schedule_cases(100_000, slow=True),
+    ]
+
+
+def _call(op: Callable[[], Any], is_async: bool, number: int) -> float:
+    """Время number вызовов op, секунд."""
+    if is_async:
+        async def loop() -> float:
+            started = time.perf_counter()
+            for _ in range(number):
+                await op()
+            return time.perf_counter() - started
+        return LOOP.run_until_complete(loop())
+    started = time.perf_counter()
+    for _ in range(number):
+        op()
+    return time.perf_counter() - started
+
+
+def measure(case: Case, repeat: int, min_time: float) -> Dict[str, Any]:
+    op = case.make()
+    if case.batch:
+        number = 1
+        while _call(op, case.is_async, number) < min_time and number < 10_000_000:
+            number *= 2
+        runs = [_call(op, case.is_async, number) / number for _ in range(repeat)]
+    else:
+        runs = []
+        for _ in range(repeat):
+            if case.reset is not None:
+                case.reset()
+            runs.append(_call(op, case.is_async, 1))
+        number = 1
+    per_op = [r / case.ops for r in runs]
+    return {
+        "name": case.name,
+        "ns_per_op": min(per_op) * 1e9,
+        "median_ns": median(per_op) * 1e9,
+        "calls": number,
+        "ops_per_call": case.ops,
+        "repeat": repeat,
+    }
+
+
+def machine() -> str:
+    """Машина замера: модель процессора, число ядер, архитектура и Python."""
+    cpu = platform.processor()
+    try:
+        with open("/proc/cpuinfo", encoding="utf-8") as f:
+            cpu = next((line.split(":", 1)[1].strip() for line in f if line.startswith("model name")), cpu)
+    except OSError:
+        pass
+    return f"{cpu or 'unknown'} x{os.cpu_count()} {platform.machine()} {platform.python_implementation()} {platform.python_version()}"
+
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Печатает сравнение и возвращает имена регрессировавших замеров."""
+    base = {row["name"]: row for row in baseline.get("results", [])}
+    regressions = []
+    for row in results:
+        old = base.get(row["name"])
+        if old is None:
+            print(f"  {row['name']:<32} нет в базовой линии")
+            continue
+        ratio = row["ns_per_op"] / old["ns_per_op"]
+        mark = ""
+        if ratio > 1 + threshold:
+            mark = "  РЕГРЕССИЯ"
+            regressions.append(row["name"])
+        elif ratio < 1 - threshold:
+            mark = "  быстрее"
+        print(f"  {row['name']:<32} {old['ns_per_op']:>14,.0f} -> {row['ns_per_op']:>14,.0f} нс  x{ratio:.2f}{mark}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-k", dest="filter", help="только замеры, в имени которых есть подстрока")
+    parser.add_argument("--quick", action="store_true", help="пропустить тяжёлые замеры")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--min-time", type=float, default=0.1, help="минимум секунд на прогон быстрых замеров")
+    parser.add_argument("--json", help="куда записать результаты")
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="записать результаты как базовую линию")
+    parser.add_argument("--threshold", type=float, default=1.0, help="допустимое замедление (1.0 = вдвое)")
+    args = parser.parse_args()
+
+    try:
+        run(args)
+    finally:
+        # Фоновые задачи (сжатие журнала, отложенные записи) — до удаления файлов
+        pending = asyncio.all_tasks(LOOP)
+        if pending:
+            LOOP.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        shutil.rmtree(TMP, ignore_errors=True)
+
+
+def run(args: argparse.Namespace) -> None:
+    selected = [
+        c for c in cases()
+        if (not args.quick or not c.slow) and (not args.filter or args.filter in c.name)
+    ]
+    results = []
+    for case in selected:
+        row = measure(case, args.repeat, args.min_time)
+        results.append(row)
+        print(f"{case.name:<34} {row['ns_per_op']:>14,.0f} нс/оп   (медиана {row['median_ns']:,.0f})", flush=True)
+
+    report = {
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "machine": machine(),
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if args.save_baseline:
+        if args.baseline.exists() and (args.filter or args.quick):
+            # Частичный прогон обновляет только свои замеры
+            old = json.loads(args.baseline.read_text(encoding="utf-8"))
+            fresh = {row["name"] for row in results}
+            report["results"] = [r for r in old.get("results", []) if r["name"] not in fresh] + results
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"Базовая линия записана: {args.baseline}")
+        return
+
+    if not args.baseline.exists():
+        print(f"Базовой линии {args.baseline} нет — сравнение пропущено (--save-baseline)")
+        return
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    print(f"Сравнение с {args.baseline} (порог {args.threshold:.0%}):")
+    regressions = compare(results, baseline, args.threshold)
+    if baseline.get("machine") != report["machine"]:
+        print(
+            f"Базовая линия снята на другой машине ({baseline.get('machine', 'не указана')}) — "
+            "сравнение только для сведения; снимите свою: --save-baseline"
+        )
+        return
+    if regressions:
+        print(f"Регрессии: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
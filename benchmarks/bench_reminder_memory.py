@@ -0,0 +1,159 @@
+"""
+Память и время загрузки напоминаний: текущий формат против компактного.
+
+Для каждого размера генерируется reminders.json, затем каждый формат
+загружается в отдельном процессе (чтобы RSS не смешивался):
+
+- dict     — список словарей, как после json.load
+- legacy   — @dataclass с datetime и строковым UUID (прежний Reminder)
+- compact  — services.reminder_store.Reminder (__slots__, epoch int, 16 байт id)
+- columns  — services.reminder_store.ReminderColumns (array-колонки)
+
+RSS — прирост после загрузки (записи разбираются потоково).
+
+Запуск:
+    python benchmarks/bench_reminder_memory.py
+    python benchmarks/bench_reminder_memory.py --sizes 100000,1000000 --json out.json
+"""
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "bot"))
+
+FORMATS = ("dict", "legacy", "compact", "columns")
+DEFAULT_SIZES = (100_000, 1_000_000, 5_000_000)
+
+
+@dataclass
+class LegacyReminder:
+    """Прежнее представление напоминания."""
+    id: str
+    uid: int
+    at: datetime
+    msg: str
+
+
+def rss_mb() -> float:
+    """Текущий RSS процесса в МБ."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def generate(path: Path, n: int) -> None:
+    """Пишет n напоминаний в JSON-массив (построчно, без удержания в памяти)."""
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[\n")
+        for i in range(n):
+            item = {
+                "id": str(uuid.uuid4()),
+                "uid": 100_000 + i % 50_000,
+                "at": (start + timedelta(minutes=i)).isoformat(),
+                "msg": f"купить хлеб {i % 1000}",
+            }
+            f.write(json.dumps(item, ensure_ascii=False))
+            f.write(",\n" if i < n - 1 else "\n")
+        f.write("]\n")
+
+
+def _records(path: Path):
+    """Записи файла по одной (generate пишет по записи на строку)."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip().rstrip(",")
+            if line.startswith("{"):
+                yield json.loads(line)
+
+
+def load(fmt: str, path: Path):
+    """
+    Загружает файл в заданном формате. Записи разбираются потоково,
+    чтобы в RSS попадали только итоговые объекты, а не сырой список.
+    """
+    from services.reminder_store import Reminder, ReminderColumns
+
+    if fmt == "dict":
+        return list(_records(path))
+    if fmt == "legacy":
+        return [
+            LegacyReminder(id=o["id"], uid=o["uid"], at=datetime.fromisoformat(o["at"]), msg=o["msg"])
+            for o in _records(path)
+        ]
+    compact = (
+        Reminder(id=o["id"], uid=o["uid"], at=datetime.fromisoformat(o["at"]), msg=o["msg"])
+        for o in _records(path)
+    )
+    if fmt == "compact":
+        return list(compact)
+    return ReminderColumns.from_reminders(compact)
+
+
+def child(fmt: str, path: Path) -> None:
+    """Замер в отдельном процессе; печатает одну JSON-строку."""
+    import services.reminder_store  # noqa: F401 — импорт не входит в замер
+
+    gc.collect()
+    before = rss_mb()
+    started = time.perf_counter()
+    data = load(fmt, path)
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    after = rss_mb()
+    print(json.dumps({
+        "format": fmt,
+        "n": len(data),
+        "load_s": round(elapsed, 3),
+        "rss_mb": round(after - before, 1),
+    }))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)))
+    parser.add_argument("--formats", default=",".join(FORMATS))
+    parser.add_argument("--json", help="куда записать результаты")
+    parser.add_argument("--child", nargs=2, metavar=("FORMAT", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child[0], Path(args.child[1]))
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in (int(x) for x in args.sizes.split(",")):
+            path = Path(tmp) / f"reminders_{n}.json"
+            generate(path, n)
+            for fmt in args.formats.split(","):
+                out = subprocess.run(
+                    [sys.executable, __file__, "--child", fmt, str(path)],
+                    check=True, capture_output=True, text=True,
+                )
+                row = json.loads(out.stdout.strip().splitlines()[-1])
+                results.append(row)
+                print(f"{n:>10,} {fmt:<8} load {row['load_s']:>8.3f} s   rss {row['rss_mb']:>9.1f} MB", flush=True)
+            path.unlink()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Пропускная способность разбора напоминаний на смешанном корпусе.
+
+on_text разбирает каждое сообщение до отправки в OpenAI, поэтому важна
+скорость на обычном тексте, а не только на напоминаниях. Корпус —
+сообщения чата с долей напоминаний --ratio (RU и EN вперемешку):
+
+- legacy — прежний путь on_text: parse_recurrence и parse_delay,
+  цепочка из десяти якорных регулярок
+- parser — utils.parse_reminder: фильтр по первому символу и одна
+  общая грамматика
+
+Запуск:
+    python benchmarks/bench_reminder_parser.py
+    python benchmarks/bench_reminder_parser.py --size 200000 --ratio 0.02 --json out.json
+"""
+import argparse
+import datetime
+import json
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "bot"))
+
+PARSERS = ("legacy", "parser")
+
+CHAT = (
+    "привет, как дела?",
+    "что думаешь про новую работу",
+    "мне грустно сегодня",
+    "расскажи анекдот",
+    "через дорогу открыли кафе, сходить?",
+    "10 причин выучить английский",
+    "hey bro what's up",
+    "in my opinion the movie was too long",
+    "can you help me write a cover letter for a junior developer position",
+    "tomorrow is my birthday",
+    "я устал, работаю каждый день без выходных",
+    "every time I try to sleep early I fail",
+    "today 5 people came to my party",
+    "Сегодня 3 раза ходил в зал",
+)
+REMINDERS = (
+    "через 10 минут выключить плиту",
+    "через 2 часа позвонить маме",
+    "через 3 дня оплатить интернет",
+    "завтра в 9 зарядка",
+    "in 15 min check the oven",
+    "in 2 hours call John",
+    "tomorrow 18:00 gym",
+    "21.07.2027 18:00 отпуск",
+    "каждый день в 9 таблетки",
+    "every monday at 9:30 standup",
+)
+
+# Прежние parse_recurrence и parse_delay (до общей грамматики) — точка сравнения
+_EVERY_DAY_RU = re.compile(r"(?:каждый\s+день|ежедневно)\s+в\s+(\d{1,2})(?::(\d{2}))?\s+(.*)", re.I)
+_EVERY_N_RU = re.compile(r"кажд(?:ый|ые|ую)\s+(?:(\d+)\s*)?(мин|час)\w*\s+(.*)", re.I)
+_EVERY_WDAY_RU = re.compile(r"кажд(?:ый|ую|ое)\s+(пон|вто|сре|чет|пят|суб|вос)\w*\s+в\s+(\d{1,2})(?::(\d{2}))?\s+(.*)", re.I)
+_EVERY_DAY_EN = re.compile(r"(?:every\s+day|daily)\s+at\s+(\d{1,2})(?::(\d{2}))?\s+(.*)", re.I)
+_EVERY_N_EN = re.compile(r"every\s+(?:(\d+)\s*)?(min|hour)\w*\s+(.*)", re.I)
+_EVERY_WDAY_EN = re.compile(r"every\s+(mon|tue|wed|thu|fri|sat|sun)\w*\s+at\s+(\d{1,2})(?::(\d{2}))?\s+(.*)", re.I)
+_CRON = re.compile(r"cron\s+(\S+\s+\S+\s+\S+\s+\S+\s+\S+)\s+(.*)", re.I)
+R_MIN_RU = re.compile(r"через\s+(\d+)\s*мин(?:ут[ыу]?)?\s+(.*)", re.I)
+R_HR_RU = re.compile(r"через\s+(\d+)\s*час(?:а|ов)?\s+(.*)", re.I)
+R_MIN_EN = re.compile(r"in\s+(\d+)\s*min(?:s|utes)?\s+(.*)", re.I)
+R_HR_EN = re.compile(r"in\s+(\d+)\s*hour(?:s)?\s+(.*)", re.I)
+R_DATE_TIME = re.compile(r"(\d{2})[./](\d{2})[./](\d{4})\s+(\d{2}):(\d{2})\s+(.*)")
+
+
+def legacy_recurrence(text: str, lang: str):
+    text = text.strip()
+    m = _CRON.match(text)
+    if m:
+        return m.group(1), m.group(2).strip()
+    if lang == "RU":
+        day, every, wday = _EVERY_DAY_RU, _EVERY_N_RU, _EVERY_WDAY_RU
+    else:
+        day, every, wday = _EVERY_DAY_EN, _EVERY_N_EN, _EVERY_WDAY_EN
+    for regex in (day, wday, every):
+        m = regex.match(text)
+        if m:
+            return m.groups()[:-1], m.group(m.lastindex).strip()
+    return None
+
+
+def legacy_delay(text: str, lang: str):
+    m = R_DATE_TIME.match(text.strip())
+    if m:
+        try:
+            dt = datetime.datetime(int(m.group(3)), int(m.group(2)), int(m.group(1)), int(m.group(4)), int(m.group(5)))
+            return dt, m.group(6).strip()
+        except Exception:
+            return None
+    if lang == "RU":
+        m = R_MIN_RU.match(text)
+        if m:
+            return int(m.group(1)), m.group(2).strip()
+        m = R_HR_RU.match(text)
+        if m:
+            return int(m.group(1)) * 60, m.group(2).strip()
+    else:
+        m = R_MIN_EN.match(text)
+        if m:
+            return int(m.group(1)), m.group(2).strip()
+        m = R_HR_EN.match(text)
+        if m:
+            return int(m.group(1)) * 60, m.group(2).strip()
+    return None
+
+
+def corpus(size: int, ratio: float, seed: int = 1):
+    """(текст, язык) — обычные сообщения с долей ratio напоминаний."""
+    rnd = random.Random(seed)
+    items = []
+    for _ in range(size):
+        text = rnd.choice(REMINDERS if rnd.random() < ratio else CHAT)
+        lang = "RU" if re.search("[а-я]", text) else "EN"
+        items.append((text, lang))
+    return items
+
+
+def legacy_parse(text: str, lang: str):
+    return legacy_recurrence(text, lang) or legacy_delay(text, lang)
+
+
+def make(name: str):
+    if name == "legacy":
+        return legacy_parse
+    from utils.parse_reminder import parse_reminder
+
+    return parse_reminder
+
+
+def run(name: str, items, repeat: int) -> dict:
+    parse = make(name)
+    best = float("inf")
+    hits = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        hits = sum(1 for text, lang in items if parse(text, lang))
+        best = min(best, time.perf_counter() - started)
+    return {"parser": name, "messages": len(items), "hits": hits, "seconds": best, "msgs_per_s": len(items) / best}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100_000)
+    parser.add_argument("--ratio", type=float, default=0.05, help="доля напоминаний в корпусе")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--parsers", default=",".join(PARSERS))
+    parser.add_argument("--json", help="куда записать результаты")
+    args = parser.parse_args()
+
+    items = corpus(args.size, args.ratio)
+    results = []
+    for name in args.parsers.split(","):
+        row = run(name, items, args.repeat)
+        results.append(row)
+        print(f"{name:<8} {row['msgs_per_s']:>12,.0f} msg/s   {row['hits']:>8,} распознано", flush=True)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
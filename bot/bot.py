@@ -1,12 +1,9 @@
 import os
-from dotenv import load_dotenv
 from telegram.ext import Application, CommandHandler
 
-# Загрузка переменных окружения
-load_dotenv()
-
+# Переменные окружения загружает main.py при старте
 # Импорт функции-обработчика /start
-from bot.handlers.start_handler import start
+from handlers.start_handler import start
 
 
 async def create_bot() -> Application:
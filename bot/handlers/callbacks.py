@@ -1,23 +1,15 @@
-import os
 import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from utils.lang import T, get_lang, get_keyboard
-from utils.json_utils import safe_load_json, async_save_json
-
-USER_JSON_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "user_data.json")
-
-def _load_user_data():
-    return safe_load_json(USER_JSON_PATH, {})
+from services.profile_store import profiles
 
 async def on_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     user_id = query.from_user.id
-    sid = str(user_id)
 
-    # Всегда обновляем user_data из файла
-    user_data = _load_user_data()
+    # Профиль из кеша в памяти, без чтения файла
     lang = get_lang(user_id)
     t = T[lang]
 
@@ -31,9 +23,8 @@ async def on_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await query.message.reply_text("🌐 Выбери язык | Choose language:", reply_markup=kb)
 
         elif query.data.startswith("lang_"):
-            user_data.setdefault(sid, {})["language"] = query.data.split("_")[1]
-            await async_save_json(USER_JSON_PATH, user_data)
-            await query.edit_message_text(t["lang_set"], reply_markup=get_keyboard(user_data[sid].get("language", "RU")))
+            await profiles.update(user_id, language=query.data.split("_")[1])
+            await query.edit_message_text(t["lang_set"], reply_markup=get_keyboard(get_lang(user_id)))
 
         elif query.data == "style":
             kb_s = [
@@ -44,8 +35,7 @@ async def on_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await query.message.reply_text(t["choose_style"], reply_markup=InlineKeyboardMarkup(kb_s))
 
         elif query.data.startswith("s_"):
-            user_data.setdefault(sid, {})["style"] = query.data.split("_")[1]
-            await async_save_json(USER_JSON_PATH, user_data)
+            await profiles.update(user_id, style=query.data.split("_")[1])
             await query.message.reply_text(t["style_ok"])
 
         elif query.data == "gender":
@@ -59,15 +49,14 @@ async def on_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         elif query.data.startswith("g_"):
             g = query.data.split("_")[1]
             if g == "skip":
-                user_data.setdefault(sid, {}).pop("gender", None)
+                await profiles.update(user_id, gender=None)
                 await query.message.reply_text(t["reset"])
             else:
-                user_data.setdefault(sid, {})["gender"] = "female" if g == "female" else "male"
+                await profiles.update(user_id, gender="female" if g == "female" else "male")
                 await query.message.reply_text(t["saved"].format(t[g]))
-            await async_save_json(USER_JSON_PATH, user_data)
 
         elif query.data == "prof":
-            d = user_data.get(sid, {})
+            d = profiles.get(user_id)
             prof_lines = [
                 f"{t['lang']}: {d.get('language', '-')}",
                 f"{t['style']}: {d.get('style', '-')}",
@@ -76,8 +65,7 @@ async def on_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await query.message.reply_text("🧑‍💼 Профиль:\n" + "\n".join(prof_lines))
 
         elif query.data == "clear":
-            user_data.pop(sid, None)
-            await async_save_json(USER_JSON_PATH, user_data)
+            await profiles.clear(user_id)
             await query.message.reply_text("🗑️ Данные профиля удалены.")
 
         else:
@@ -1,11 +1,7 @@
 # handlers/reminders.py
 
 import logging
-import uuid
-from pathlib import Path
-from dataclasses import dataclass, asdict
 from typing import List
-import datetime
 
 from telegram import (
     Update,
@@ -20,69 +16,18 @@ from telegram.ext import (
 )
 
 from utils.lang import get_lang, T
-from utils.json_utils import safe_load_json, async_save_json
+from services.recurrence import format_local
+from services.reminder_store import Reminder, get_registry
 
 # Логгер модуля
 logger = logging.getLogger(__name__)
 
-# Пути
-DATA_DIR = Path(__file__).parent.parent / "data"
-DATA_DIR.mkdir(parents=True, exist_ok=True)
-REMINDERS_FILE = DATA_DIR / "reminders.json"
-
-
-@dataclass
-class Reminder:
-    """Структура напоминания."""
-    id: str
-    uid: int
-    at: datetime.datetime
-    msg: str
-
-
-def _load_reminders() -> List[Reminder]:
-    """
-    Загрузить все напоминания из файла.
-    Игнорирует некорректные записи с ошибками парсинга.
-    """
-    raw = safe_load_json(str(REMINDERS_FILE), [])
-    result: List[Reminder] = []
-    for item in raw:
-        try:
-            rem = Reminder(
-                id=item["id"],
-                uid=item["uid"],
-                at=datetime.datetime.fromisoformat(item["at"]),
-                msg=item["msg"],
-            )
-            result.append(rem)
-        except Exception:
-            logger.exception("Невозможно распарсить запись напоминания: %s", item)
-    return result
-
-
-async def _save_reminders(reminders: List[Reminder]) -> None:
-    """
-    Асинхронно сохранить список напоминаний в файл.
-    """
-    data = [asdict(r) for r in reminders]
-    try:
-        await async_save_json(str(REMINDERS_FILE), data)
-    except OSError:
-        logger.exception("Ошибка записи файла напоминаний")
-
 
 def _get_user_reminders(context: ContextTypes.DEFAULT_TYPE, user_id: int) -> List[Reminder]:
     """
-    Получить список напоминаний для пользователя:
-    из cache в bot_data или загрузить из файла.
+    Получить список напоминаний пользователя из индекса реестра.
     """
-    cache = context.application.bot_data.get("reminders")
-    if cache is None:
-        cache = _load_reminders()
-        context.application.bot_data["reminders"] = cache
-    # Фильтр по пользователю
-    return [r for r in cache if r.uid == user_id]
+    return get_registry(context.application).for_user(user_id)
 
 
 def _format_reminders(reminders: List[Reminder], lang: str) -> str:
@@ -91,7 +36,7 @@ def _format_reminders(reminders: List[Reminder], lang: str) -> str:
     """
     lines = []
     for r in reminders:
-        dt = r.at.strftime("%d.%m.%Y %H:%M")
+        dt = format_local(r.at)
         lines.append(f"{dt} — {r.msg}")
     return T[lang]["reminders_list"] + "\n" + "\n".join(lines)
 
@@ -153,20 +98,13 @@ async def delete_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     rem_id = parts[1]
 
     try:
-        all_rems: List[Reminder] = context.application.bot_data.get("reminders") or _load_reminders()
-        new_rems = [
-            r for r in all_rems
-            if not (r.uid == user_id and r.id == rem_id)
-        ]
-        if len(new_rems) == len(all_rems):
+        # Удаляем только напоминание этого пользователя
+        removed = await get_registry(context.application).delete([rem_id], uid=user_id)
+        if not removed:
             # ничего не удалилось
             await query.message.reply_text(T[lang]["err"])
             return
 
-        # Сохраняем обновлённый список
-        context.application.bot_data["reminders"] = new_rems
-        await _save_reminders(new_rems)
-
         await query.message.reply_text(T[lang]["reminder_deleted"])
         logger.info("Удалено напоминание %s для пользователя %s", rem_id, user_id)
 
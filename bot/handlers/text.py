@@ -1,25 +1,25 @@
-from pathlib import Path
 from dataclasses import dataclass
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timezone
+from uuid import uuid4
 import logging
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, Optional, Tuple
 
 from telegram import Update, Message
 from telegram.ext import ContextTypes
 
 from utils.lang import get_lang, T
-from utils.parse_reminder import parse_delay
-from utils.json_utils import safe_load_json, async_save_json
-from services.openai_service import ask_openai
+from utils.parse_reminder import format_delta, parse_reminder
+from services.openai_service import OPENAI_STREAM, ask_openai, get_client
+from services.stream_reply import StreamingReply
+from handlers.add_reminder import add_recurring
+from services.profile_store import profiles
+from services.history_store import get_history
+from services.recurrence import RecurrenceRule
+from services.reminder_store import Reminder as StoredReminder, get_registry
 
 # Логгер модуля
 logger = logging.getLogger(__name__)
 
-# Путь к файлу и создание директории для данных
-DATA_DIR = Path(__file__).parent.parent / "data"
-DATA_DIR.mkdir(parents=True, exist_ok=True)
-REMINDERS_PATH = DATA_DIR / "reminders.json"
-
 @dataclass
 class Reminder:
     """Структура напоминания без идентификатора."""
@@ -31,17 +31,16 @@ def parse_reminder_from_delay(
     delay: Tuple[Any, str]
 ) -> Optional[Reminder]:
     """
-    Преобразует результат parse_delay в Reminder.
+    Преобразует результат parse_reminder (разовое напоминание) в Reminder.
 
-    :param delay: кортеж (datetime или int, сообщение)
+    :param delay: кортеж (aware datetime или timedelta, сообщение)
     :return: Reminder с точным временем или None
     """
     time_val, msg = delay
     if isinstance(time_val, datetime):
         at = time_val
     else:
-        minutes = int(time_val)
-        at = datetime.now(timezone.utc) + timedelta(minutes=minutes)
+        at = datetime.now(timezone.utc) + time_val
     return Reminder(at=at, msg=msg)
 
 
@@ -77,38 +76,32 @@ async def on_text(
     t = T[lang]
 
     # Данные из bot_data
-    user_data: Dict[str, Any] = context.application.bot_data.get("user_data", {})
-    user_ctx: Dict[str, Any] = context.application.bot_data.get("user_ctx", {})
-    openai_client = context.application.bot_data.get("openai_client")
-    reminders: Optional[List[Dict[str, Any]]] = context.application.bot_data.get("reminders")
+    user_data: Dict[str, Any] = profiles.data
+    user_ctx = get_history(context.application)
 
-    delay = parse_delay(text, lang)
-    if delay:
+    delay = parse_reminder(text, lang)
+    if delay and isinstance(delay[0], RecurrenceRule):
         try:
-            rem = parse_reminder_from_delay(delay)
-
-            # Загружаем из файла, если в bot_data нет
-            if reminders is None:
-                reminders = safe_load_json(str(REMINDERS_PATH), [])
+            await add_recurring(update, context, *delay)
+        except Exception:
+            logger.exception("Ошибка при добавлении повторяющегося напоминания user=%s", user_id)
+            await reply_error(message, t["err"])
 
-            # Добавляем новое напоминание
-            reminders.append({
-                "uid": user_id,
-                "at": rem.at.isoformat(),
-                "msg": rem.msg
-            })
+    elif delay:
+        try:
+            rem = parse_reminder_from_delay(delay)
 
-            # Сохраняем на диск и в bot_data
-            await async_save_json(str(REMINDERS_PATH), reminders)
-            context.application.bot_data["reminders"] = reminders
+            # Сохраняем через общий реестр напоминаний
+            stored = StoredReminder(id=str(uuid4()), uid=user_id, at=rem.at, msg=rem.msg)
+            if not await get_registry(context.application).add(stored):
+                raise OSError("Не удалось сохранить напоминание")
 
             # Формируем строку подтверждения
             time_val = delay[0]
             if isinstance(time_val, datetime):
                 date_str = rem.at.strftime("%d.%m.%Y %H:%M")
             else:
-                minutes = int(time_val)
-                date_str = f"{minutes} МИН" if lang == "RU" else f"{minutes} MIN"
+                date_str = format_delta(time_val, lang)
 
             await message.reply_text(
                 t["rem_save"].format(d=date_str, m=rem.msg)
@@ -126,19 +119,29 @@ async def on_text(
             await reply_error(message, t["err"])
 
     else:
-        # Обрабатываем через OpenAI
-        if openai_client is None:
-            logger.error("OpenAI client не инициализирован.")
-            await reply_error(message, t["err"])
-            return
-
+        # Обрабатываем через OpenAI (клиент создаётся при первом запросе)
+        streaming: Optional[StreamingReply] = None
         try:
-            reply = await ask_openai(
-                user_id, text, user_ctx, user_data, openai_client
-            )
-            await message.reply_text(reply)
+            openai_client = get_client()
+            if OPENAI_STREAM:
+                # Заглушка сразу, дальше правки по мере генерации
+                streaming = StreamingReply(message, t["thinking"])
+                await streaming.start()
+                reply = await ask_openai(
+                    user_id, text, user_ctx, user_data, openai_client,
+                    on_partial=streaming.append,
+                )
+                await streaming.finish(reply)
+            else:
+                reply = await ask_openai(
+                    user_id, text, user_ctx, user_data, openai_client
+                )
+                await message.reply_text(reply)
             logger.info("OpenAI ответ отправлен для user=%s", user_id)
         except Exception:
             logger.exception("OpenAI ошибка для user=%s", user_id)
-            await reply_error(message, t["err"])
+            if streaming is not None and streaming.started:
+                await streaming.finish(t["err"])
+            else:
+                await reply_error(message, t["err"])
 
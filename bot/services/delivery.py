@@ -0,0 +1,305 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+from telegram.error import BadRequest, ChatMigrated, Forbidden, InvalidToken, NetworkError, RetryAfter
+
+# Логгер модуля
+logger = logging.getLogger(__name__)
+
+# Лимиты Telegram: ~30 сообщений/с на бота, ~1 сообщение/с в один чат
+DELIVERY_GLOBAL_RATE = float(os.getenv("DELIVERY_GLOBAL_RATE", "30"))
+DELIVERY_CHAT_RATE = float(os.getenv("DELIVERY_CHAT_RATE", "1"))
+DELIVERY_CHAT_BURST = float(os.getenv("DELIVERY_CHAT_BURST", "3"))
+# Число отправителей, размер очереди и повторы
+DELIVERY_WORKERS = int(os.getenv("DELIVERY_WORKERS", "16"))
+DELIVERY_QUEUE_SIZE = int(os.getenv("DELIVERY_QUEUE_SIZE", "10000"))
+DELIVERY_MAX_ATTEMPTS = int(os.getenv("DELIVERY_MAX_ATTEMPTS", "5"))
+DELIVERY_BACKOFF = float(os.getenv("DELIVERY_BACKOFF", "1.0"))
+DELIVERY_MAX_BACKOFF = float(os.getenv("DELIVERY_MAX_BACKOFF", "60"))
+
+# Итог доставки
+DELIVERED = "delivered"  # Telegram подтвердил отправку
+REJECTED = "rejected"    # постоянная ошибка (бот заблокирован, чат не найден) — повторять бессмысленно
+FAILED = "failed"        # временные ошибки не прошли за все попытки
+
+# Ошибки, после которых повтор не поможет (BadRequest — подкласс NetworkError, проверяется раньше)
+_PERMANENT = (Forbidden, BadRequest, ChatMigrated, InvalidToken)
+
+# Сколько корзин чатов держать, прежде чем выбрасывать простаивающие
+_MAX_CHAT_BUCKETS = 10000
+
+SendCallback = Callable[[], Awaitable[Any]]
+
+
+class TokenBucket:
+    """
+    Корзина токенов: rate токенов в секунду, не больше burst подряд.
+    acquire() резервирует токен сразу (баланс может уйти в минус) и
+    ждёт своей очереди, поэтому конкурентные отправители не обгоняют
+    лимит. reserve() — то же без ожидания. pause() останавливает выдачу
+    (например, по retry_after).
+    """
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def idle(self) -> bool:
+        """Корзина полна (давно не использовалась)."""
+        self._refill(time.monotonic())
+        return self.tokens >= self.burst
+
+    def pause(self, seconds: float) -> None:
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def reserve(self) -> float:
+        """Берёт токен и возвращает 0, если он есть; иначе — сколько ждать (токен не берётся)."""
+        now = time.monotonic()
+        if self.paused_until > now:
+            return self.paused_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self) -> None:
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+        while True:
+            wait = self.paused_until - time.monotonic()
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+
+@dataclass
+class _Delivery:
+    chat_id: int
+    send: SendCallback
+    result: asyncio.Future
+    attempt: int = 0
+
+
+class DeliveryPipeline:
+    """
+    Доставка сообщений в Telegram: ограниченная очередь, пул из workers
+    отправителей, общая корзина токенов на бота и по корзине на чат.
+
+    Сообщения копятся в очередях чатов (по порядку), отправители берут
+    из общей очереди готовых чатов. Лимит чата проверяется до отправки
+    без ожидания: чат без токена возвращается в очередь готовых по
+    таймеру, а отправитель тем временем обслуживает другие чаты —
+    один чат с длинной очередью не занимает весь пул.
+
+    RetryAfter (429) приостанавливает всю отправку на retry_after и
+    повторяет сообщение; сетевые ошибки повторяются с экспоненциальной
+    задержкой. deliver() возвращает DELIVERED, REJECTED или FAILED —
+    вызывающий удаляет данные только после подтверждения.
+    """
+
+    def __init__(
+        self,
+        workers: int = DELIVERY_WORKERS,
+        global_rate: float = DELIVERY_GLOBAL_RATE,
+        chat_rate: float = DELIVERY_CHAT_RATE,
+        chat_burst: float = DELIVERY_CHAT_BURST,
+        queue_size: int = DELIVERY_QUEUE_SIZE,
+        max_attempts: int = DELIVERY_MAX_ATTEMPTS,
+        backoff: float = DELIVERY_BACKOFF,
+        max_backoff: float = DELIVERY_MAX_BACKOFF,
+    ) -> None:
+        self.workers = workers
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._global = TokenBucket(global_rate, max(1.0, global_rate))
+        self._chats: Dict[int, TokenBucket] = {}
+        # Очереди чатов; чат есть здесь, пока у него есть сообщения
+        self._pending: Dict[int, Deque[_Delivery]] = {}
+        # Чаты, готовые к отправке, и чаты, ждущие токена своей корзины
+        self._ready: Optional[asyncio.Queue] = None
+        self._waiting: Dict[int, asyncio.TimerHandle] = {}
+        # Место в очереди: deliver() ждёт, если сообщений уже queue_size
+        self._space: Optional[asyncio.Semaphore] = None
+        self._queue_size = queue_size
+        self._queued = 0
+        self._tasks: List[asyncio.Task] = []
+        self._retries: Set[asyncio.Task] = set()
+        self._counters = {DELIVERED: 0, REJECTED: 0, FAILED: 0, "retries": 0, "rate_limited": 0}
+
+    def _chat(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= _MAX_CHAT_BUCKETS:
+                self._chats = {k: b for k, b in self._chats.items() if not b.idle()}
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def start(self) -> None:
+        """Запускает отправителей (в работающем цикле событий)."""
+        if self._tasks:
+            return
+        self._ready = asyncio.Queue()
+        self._space = asyncio.Semaphore(self._queue_size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        """Останавливает отправителей; недоставленное получает FAILED."""
+        for handle in self._waiting.values():
+            handle.cancel()
+        self._waiting.clear()
+        for task in list(self._retries) + self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._retries, *self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._retries.clear()
+        for items in self._pending.values():
+            for item in items:
+                self._finish(item, FAILED)
+        self._pending.clear()
+        self._queued = 0
+
+    async def deliver(self, chat_id: int, send: SendCallback) -> str:
+        """
+        Ставит отправку в очередь (ждёт места, если она полна) и
+        возвращает итог доставки. send вызывается на каждую попытку.
+        """
+        self.start()
+        item = _Delivery(chat_id, send, asyncio.get_running_loop().create_future())
+        await self._space.acquire()
+        self._enqueue(item)
+        return await item.result
+
+    def _enqueue(self, item: _Delivery, first: bool = False) -> None:
+        """Кладёт сообщение в очередь чата (first — в начало, для повтора)."""
+        items = self._pending.get(item.chat_id)
+        if items is None:
+            items = self._pending[item.chat_id] = deque()
+            self._ready.put_nowait(item.chat_id)
+        if first:
+            items.appendleft(item)
+        else:
+            items.append(item)
+        self._queued += 1
+
+    def _take(self, chat_id: int) -> Optional[_Delivery]:
+        """
+        Следующее сообщение готового чата, если у чата есть токен;
+        иначе чат вернётся в очередь готовых, когда токен появится.
+        """
+        items = self._pending.get(chat_id)
+        if not items:
+            self._pending.pop(chat_id, None)
+            return None
+        wait = self._chat(chat_id).reserve()
+        if wait > 0:
+            self._waiting[chat_id] = asyncio.get_running_loop().call_later(wait, self._wake, chat_id)
+            return None
+        item = items.popleft()
+        self._queued -= 1
+        if item.attempt == 0:
+            self._space.release()
+        if items:
+            # Остальные сообщения чата — в конец очереди готовых, после других чатов
+            self._ready.put_nowait(chat_id)
+        else:
+            del self._pending[chat_id]
+        return item
+
+    def _wake(self, chat_id: int) -> None:
+        self._waiting.pop(chat_id, None)
+        self._ready.put_nowait(chat_id)
+
+    def _finish(self, item: _Delivery, status: str) -> None:
+        self._counters[status] += 1
+        if not item.result.done():
+            item.result.set_result(status)
+
+    def _retry(self, item: _Delivery, delay: float) -> None:
+        """Возвращает сообщение в очередь через delay секунд, не занимая отправителя."""
+        if item.attempt >= self.max_attempts:
+            logger.warning("Доставка в чат %s не удалась за %s попыток", item.chat_id, item.attempt)
+            self._finish(item, FAILED)
+            return
+        self._counters["retries"] += 1
+
+        async def requeue() -> None:
+            try:
+                await asyncio.sleep(delay)
+                self._enqueue(item, first=True)
+            except asyncio.CancelledError:
+                self._finish(item, FAILED)
+                raise
+
+        task = asyncio.create_task(requeue())
+        self._retries.add(task)
+        task.add_done_callback(self._retries.discard)
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _attempt(self, item: _Delivery) -> None:
+        # Токен чата уже взят в _take; общий лимит — одинаковый для всех чатов
+        await self._global.acquire()
+        item.attempt += 1
+        try:
+            await item.send()
+        except RetryAfter as e:
+            # 429: Telegram просит подождать — притормаживаем всю отправку
+            self._counters["rate_limited"] += 1
+            delay = float(e.retry_after)
+            logger.warning("Telegram 429, пауза %s с (чат %s)", delay, item.chat_id)
+            self._global.pause(delay)
+            self._retry(item, delay)
+        except _PERMANENT as e:
+            logger.warning("Сообщение в чат %s не доставлено: %s", item.chat_id, e)
+            self._finish(item, REJECTED)
+        except NetworkError as e:
+            logger.warning("Сетевая ошибка отправки в чат %s (попытка %s): %s", item.chat_id, item.attempt, e)
+            self._retry(item, self._backoff(item.attempt))
+        except Exception:
+            logger.exception("Ошибка отправки в чат %s (попытка %s)", item.chat_id, item.attempt)
+            self._retry(item, self._backoff(item.attempt))
+        else:
+            self._finish(item, DELIVERED)
+
+    async def _worker(self) -> None:
+        while True:
+            item = self._take(await self._ready.get())
+            if item is None:
+                continue
+            try:
+                await self._attempt(item)
+            except asyncio.CancelledError:
+                self._finish(item, FAILED)
+                raise
+
+    def stats(self) -> Dict[str, int]:
+        """Метрики доставки."""
+        return {
+            **self._counters,
+            "queued": self._queued,
+            "retrying": len(self._retries),
+            "chats": len(self._chats),
+        }
@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+# Логгер модуля
+logger = logging.getLogger(__name__)
+
+# Окно сводки, секунд: напоминания пользователя, наступившие в пределах окна,
+# уходят одним сообщением (0 — каждое отдельно)
+REMINDER_DIGEST_WINDOW = float(os.getenv("REMINDER_DIGEST_WINDOW", "0"))
+# Сводка отправляется раньше, если набралось столько напоминаний или символов
+# (лимит сообщения Telegram — 4096 символов)
+REMINDER_DIGEST_MAX_ITEMS = int(os.getenv("REMINDER_DIGEST_MAX_ITEMS", "25"))
+REMINDER_DIGEST_MAX_CHARS = int(os.getenv("REMINDER_DIGEST_MAX_CHARS", "3500"))
+
+FlushCallback = Callable[[int, List[Any]], Awaitable[str]]
+
+
+@dataclass
+class _Batch:
+    items: List[Any] = field(default_factory=list)
+    chars: int = 0
+    result: asyncio.Future = field(default_factory=lambda: asyncio.get_running_loop().create_future())
+    timer: Optional[asyncio.Task] = None
+
+
+class DigestCoalescer:
+    """
+    Собирает элементы одного чата, пришедшие в течение window секунд
+    после первого, и отдаёт их в flush(chat_id, items) одной пачкой.
+
+    add() ждёт отправки своей пачки и возвращает итог flush (например,
+    статус доставки) — вызывающий решает судьбу элемента по нему.
+    Пачка уходит раньше окна, если набрала max_items элементов или
+    max_chars символов (size — оценка длины элемента). После stop()
+    элементы уходят сразу, без окна.
+    """
+
+    def __init__(
+        self,
+        flush: FlushCallback,
+        window: float = REMINDER_DIGEST_WINDOW,
+        max_items: int = REMINDER_DIGEST_MAX_ITEMS,
+        max_chars: int = REMINDER_DIGEST_MAX_CHARS,
+        size: Callable[[Any], int] = lambda item: 0,
+    ) -> None:
+        self.flush = flush
+        self.window = window
+        self.max_items = max_items
+        self.max_chars = max_chars
+        self.size = size
+        self._batches: Dict[int, _Batch] = {}
+        self._sending: Set[asyncio.Task] = set()
+        self._counters = {"items": 0, "flushed": 0}
+        self._closed = False
+
+    async def add(self, chat_id: int, item: Any) -> str:
+        """Добавляет элемент в пачку чата и ждёт её отправки."""
+        size = self.size(item)
+        batch = self._batches.get(chat_id)
+        if batch is not None and batch.items and batch.chars + size > self.max_chars:
+            # Не влезает в сообщение — текущая пачка уходит сейчас, элемент начинает новую
+            self._send_now(chat_id)
+            batch = None
+        if batch is None:
+            batch = _Batch()
+            batch.timer = asyncio.create_task(self._send_later(chat_id, batch))
+            self._sending.add(batch.timer)
+            batch.timer.add_done_callback(self._sending.discard)
+            self._batches[chat_id] = batch
+        batch.items.append(item)
+        batch.chars += size
+        self._counters["items"] += 1
+        result = batch.result
+        if self._closed or len(batch.items) >= self.max_items:
+            self._send_now(chat_id)
+        return await asyncio.shield(result)
+
+    def _send_now(self, chat_id: int) -> None:
+        batch = self._batches.pop(chat_id)
+        batch.timer.cancel()
+        task = asyncio.create_task(self._send(chat_id, batch))
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    async def _send_later(self, chat_id: int, batch: _Batch) -> None:
+        await asyncio.sleep(self.window)
+        if self._batches.get(chat_id) is batch:
+            del self._batches[chat_id]
+        await self._send(chat_id, batch)
+
+    async def _send(self, chat_id: int, batch: _Batch) -> None:
+        self._counters["flushed"] += 1
+        try:
+            status = await self.flush(chat_id, batch.items)
+        except Exception as e:
+            logger.exception("Ошибка отправки сводки в чат %s", chat_id)
+            if not batch.result.done():
+                batch.result.set_exception(e)
+            return
+        if not batch.result.done():
+            batch.result.set_result(status)
+
+    async def stop(self) -> None:
+        """Отправляет накопленные пачки, не дожидаясь окна; новые — сразу."""
+        self._closed = True
+        for chat_id in list(self._batches):
+            batch = self._batches.pop(chat_id)
+            batch.timer.cancel()
+            await self._send(chat_id, batch)
+        if self._sending:
+            await asyncio.gather(*list(self._sending), return_exceptions=True)
+
+    def stats(self) -> Dict[str, int]:
+        """Метрики: сколько элементов принято и сколько сообщений ушло."""
+        return {**self._counters, "pending": sum(len(b.items) for b in self._batches.values())}
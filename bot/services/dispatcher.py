@@ -0,0 +1,104 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List
+
+# Логгер модуля
+logger = logging.getLogger(__name__)
+
+UpdateProcessor = Callable[[Any], Awaitable[None]]
+
+
+def lane_key(update: Any) -> int:
+    """
+    Ключ шардирования апдейта: id пользователя, иначе id чата,
+    иначе update_id (такие апдейты порядка между собой не требуют).
+    """
+    user = getattr(update, "effective_user", None)
+    if user is not None:
+        return user.id
+    chat = getattr(update, "effective_chat", None)
+    if chat is not None:
+        return chat.id
+    return getattr(update, "update_id", 0) or 0
+
+
+class ShardedDispatcher:
+    """
+    Раскладывает апдейты по N полосам по id пользователя.
+    Апдейты разных пользователей обрабатываются параллельно,
+    апдейты одного пользователя — строго по порядку в своей полосе.
+    """
+
+    def __init__(
+        self,
+        process: UpdateProcessor,
+        lanes: int = 8,
+        lane_size: int = 100,
+    ) -> None:
+        if lanes <= 0:
+            raise ValueError("lanes должен быть положительным")
+        self._process = process
+        self._queues: List[asyncio.Queue] = [asyncio.Queue(maxsize=lane_size) for _ in range(lanes)]
+        self._tasks: List[asyncio.Task] = []
+        self.processed = 0
+        self.failed = 0
+
+    @property
+    def lanes(self) -> int:
+        return len(self._queues)
+
+    def lane_of(self, update: Any) -> int:
+        """Номер полосы для апдейта."""
+        return lane_key(update) % len(self._queues)
+
+    async def submit(self, update: Any) -> None:
+        """
+        Ставит апдейт в его полосу. Если полоса заполнена — ждёт,
+        передавая давление назад во входную очередь webhook.
+        """
+        await self._queues[self.lane_of(update)].put(update)
+
+    async def _worker(self, queue: asyncio.Queue) -> None:
+        """Обработчик одной полосы: апдейты по одному, в порядке поступления."""
+        while True:
+            update = await queue.get()
+            try:
+                await self._process(update)
+                self.processed += 1
+            except Exception:
+                self.failed += 1
+                logger.exception("Ошибка обработки апдейта в полосе")
+            finally:
+                queue.task_done()
+
+    def start(self) -> None:
+        """Запускает обработчики полос."""
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker(q)) for q in self._queues]
+
+    async def stop(self, drain_timeout: float = 5.0) -> None:
+        """
+        Дожидается разбора полос (не дольше drain_timeout секунд)
+        и останавливает обработчики.
+        """
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(q.join() for q in self._queues)), timeout=drain_timeout
+            )
+        except asyncio.TimeoutError:
+            logger.warning("Не дождались разбора полос: осталось %s", sum(q.qsize() for q in self._queues))
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> Dict[str, Any]:
+        """Глубина каждой полосы и счётчики."""
+        return {
+            "lanes": self.lanes,
+            "depths": [q.qsize() for q in self._queues],
+            "processed": self.processed,
+            "failed": self.failed,
+        }
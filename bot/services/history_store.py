@@ -0,0 +1,174 @@
+import logging
+import os
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+from utils.json_utils import cancel_pending_json, pending_save, safe_load_json, save_json_later
+
+# Логгер модуля
+logger = logging.getLogger(__name__)
+
+DATA_DIR = Path(__file__).parent.parent / "data"
+# Каталог историй: по файлу на пользователя
+USER_CTX_DIR = DATA_DIR / "user_ctx"
+# Старый общий файл историй (импортируется один раз, если есть)
+USER_CTX_FILE = DATA_DIR / "user_ctx.json"
+
+# Сколько активных пользователей держать в памяти и общий бюджет памяти историй (байт)
+HISTORY_HOT_USERS = int(os.getenv("HISTORY_HOT_USERS", "1000"))
+HISTORY_MEMORY_BUDGET = int(os.getenv("HISTORY_MEMORY_BUDGET", str(16 * 1024 * 1024)))
+
+History = List[Dict[str, str]]
+UserKey = Union[int, str]
+
+# Примерные накладные расходы на одно сообщение (dict и строки), байт
+_MESSAGE_OVERHEAD = 300
+
+
+def _size(history: Any) -> int:
+    """Примерный объём истории в памяти, байт."""
+    if not isinstance(history, list):
+        return _MESSAGE_OVERHEAD
+    return sum(
+        _MESSAGE_OVERHEAD + len(m.get("content", "")) * 2 if isinstance(m, dict) else _MESSAGE_OVERHEAD
+        for m in history
+    )
+
+
+class HistoryStore(MutableMapping):
+    """
+    История диалогов пользователей {uid: [сообщения]}.
+
+    В памяти — последние активные пользователи (LRU) в пределах
+    max_users и общего бюджета budget байт; остальные лежат на диске
+    (data/user_ctx/<uid>.json) и подгружаются при первом обращении.
+    Каждое присваивание ставится на отложенную запись json_utils,
+    поэтому вытеснение ничего не пишет, а история переживает перезапуск.
+    """
+
+    def __init__(
+        self,
+        directory: Path = USER_CTX_DIR,
+        max_users: int = HISTORY_HOT_USERS,
+        budget: int = HISTORY_MEMORY_BUDGET,
+        legacy_file: Optional[Path] = USER_CTX_FILE,
+    ) -> None:
+        self.dir = directory
+        self.max_users = max(1, max_users)
+        self.budget = budget
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._hot: "OrderedDict[UserKey, History]" = OrderedDict()
+        self._sizes: Dict[UserKey, int] = {}
+        self._used = 0
+        self.loads = 0
+        self.evictions = 0
+        if legacy_file is not None and legacy_file.exists():
+            self._migrate(legacy_file)
+
+    def _migrate(self, legacy_file: Path) -> None:
+        """Разовый перенос общего user_ctx.json в файлы пользователей."""
+        data = safe_load_json(str(legacy_file), {})
+        if isinstance(data, dict):
+            for uid, history in data.items():
+                save_json_later(str(self._path(uid)), history)
+        os.replace(legacy_file, legacy_file.with_name(legacy_file.name + ".migrated"))
+        logger.info("Перенесено %s историй из %s", len(data), legacy_file)
+
+    def _path(self, uid: UserKey) -> Path:
+        return self.dir / f"{uid}.json"
+
+    def _load(self, uid: UserKey) -> Optional[History]:
+        """История с диска (или ещё не записанная), None — если её нет."""
+        path = str(self._path(uid))
+        data = pending_save(path)
+        if data is None:
+            if not os.path.exists(path):
+                return None
+            data = safe_load_json(path, None)
+            self.loads += 1
+        return data if isinstance(data, list) else None
+
+    def _remember(self, uid: UserKey, history: History) -> None:
+        """Кладёт историю в горячий слой и вытесняет лишнее."""
+        self._used -= self._sizes.pop(uid, 0)
+        self._hot[uid] = history
+        self._hot.move_to_end(uid)
+        size = _size(history)
+        self._sizes[uid] = size
+        self._used += size
+        while len(self._hot) > 1 and (len(self._hot) > self.max_users or self._used > self.budget):
+            old, _ = self._hot.popitem(last=False)
+            self._used -= self._sizes.pop(old, 0)
+            self.evictions += 1
+
+    def __getitem__(self, uid: UserKey) -> History:
+        history = self._hot.get(uid)
+        if history is not None:
+            self._hot.move_to_end(uid)
+            return history
+        history = self._load(uid)
+        if history is None:
+            raise KeyError(uid)
+        self._remember(uid, history)
+        return history
+
+    def __setitem__(self, uid: UserKey, history: History) -> None:
+        self._remember(uid, history)
+        save_json_later(str(self._path(uid)), history)
+
+    def __delitem__(self, uid: UserKey) -> None:
+        present = uid in self
+        self._used -= self._sizes.pop(uid, 0)
+        self._hot.pop(uid, None)
+        path = self._path(uid)
+        cancel_pending_json(str(path))
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            if not present:
+                raise KeyError(uid)
+
+    def __contains__(self, uid: object) -> bool:
+        try:
+            self[uid]
+        except KeyError:
+            return False
+        return True
+
+    def _disk_keys(self) -> Iterator[UserKey]:
+        for path in self.dir.glob("*.json"):
+            stem = path.stem
+            yield int(stem) if stem.lstrip("-").isdigit() else stem
+
+    def __iter__(self) -> Iterator[UserKey]:
+        seen = set(self._hot)
+        yield from list(self._hot)
+        for uid in self._disk_keys():
+            if uid not in seen:
+                yield uid
+
+    def __len__(self) -> int:
+        return len(set(self._hot).union(self._disk_keys()))
+
+    def stats(self) -> Dict[str, int]:
+        """Метрики горячего слоя."""
+        return {
+            "hot_users": len(self._hot),
+            "hot_bytes": self._used,
+            "loads": self.loads,
+            "evictions": self.evictions,
+        }
+
+
+def get_history(application) -> HistoryStore:
+    """
+    Общее хранилище историй приложения (bot_data["user_ctx"]),
+    создаётся при первом обращении.
+    """
+    store = application.bot_data.get("user_ctx")
+    if not isinstance(store, HistoryStore):
+        store = HistoryStore()
+        application.bot_data["user_ctx"] = store
+    return store
@@ -0,0 +1,218 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+try:
+    import orjson
+except ImportError:  # orjson не обязателен — падаем на стандартный json
+    orjson = None
+
+# Логгер модуля
+logger = logging.getLogger(__name__)
+
+# Политики при переполнении очереди
+POLICY_SHED = "shed"    # отвечаем 200 и выбрасываем апдейт
+POLICY_429 = "429"      # отвечаем 429, Telegram повторит доставку позже
+POLICY_BLOCK = "block"  # ждём освобождения места в очереди
+POLICIES = (POLICY_SHED, POLICY_429, POLICY_BLOCK)
+
+UpdateHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+def decode_body(body: bytes) -> Any:
+    """
+    Быстро декодирует тело запроса: orjson, если установлен, иначе json.
+    """
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+class UpdateDeduplicator:
+    """
+    Помнит последние update_id: кольцевой буфер фиксированного размера
+    плюс множество для проверки за O(1). Память ограничена capacity.
+    """
+
+    def __init__(self, capacity: int = 10000) -> None:
+        if capacity <= 0:
+            raise ValueError("capacity должен быть положительным")
+        self._ring: List[Optional[int]] = [None] * capacity
+        self._seen: Set[int] = set()
+        self._pos = 0
+        self.duplicates = 0
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def seen(self, update_id: int) -> bool:
+        """
+        Возвращает True, если update_id уже встречался (дубликат).
+        """
+        if update_id in self._seen:
+            self.duplicates += 1
+            return True
+        return False
+
+    def add(self, update_id: int) -> None:
+        """
+        Запоминает update_id, вытесняя самый старый.
+        """
+        if update_id in self._seen:
+            return
+        old = self._ring[self._pos]
+        if old is not None:
+            self._seen.discard(old)
+        self._ring[self._pos] = update_id
+        self._seen.add(update_id)
+        self._pos = (self._pos + 1) % len(self._ring)
+
+
+class WebhookIngress:
+    """
+    Входной слой webhook: быстро подтверждает запрос и складывает
+    апдейты в ограниченную очередь, которую разбирает фоновая задача.
+    """
+
+    def __init__(
+        self,
+        handler: UpdateHandler,
+        maxsize: int = 1000,
+        policy: str = POLICY_429,
+        dedup: Optional[UpdateDeduplicator] = None,
+    ) -> None:
+        if policy not in POLICIES:
+            raise ValueError(f"Неизвестная политика переполнения: {policy}")
+        self._handler = handler
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self._policy = policy
+        self._dedup = dedup
+        self._task: Optional[asyncio.Task] = None
+        # Счётчики
+        self.received = 0
+        self.enqueued = 0
+        self.shed = 0
+        self.rejected = 0
+        self.invalid = 0
+        self.processed = 0
+        self.failed = 0
+        self.max_depth = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    @property
+    def maxsize(self) -> int:
+        return self._queue.maxsize
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    async def ingest(self, body: bytes) -> int:
+        """
+        Принимает сырое тело запроса и возвращает HTTP-статус для ответа.
+        """
+        self.received += 1
+        try:
+            data = decode_body(body)
+        except ValueError:
+            self.invalid += 1
+            logger.warning("Невалидный JSON в webhook, пропускаю")
+            return 200
+        if not isinstance(data, dict):
+            self.invalid += 1
+            return 200
+
+        # Повторная доставка того же апдейта — подтверждаем и не обрабатываем
+        update_id = data.get("update_id")
+        if not isinstance(update_id, int):
+            update_id = None
+        if self._dedup is not None and update_id is not None and self._dedup.seen(update_id):
+            logger.info("Дубликат апдейта %s отброшен", update_id)
+            return 200
+
+        item = (time.monotonic(), data)
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            if self._policy == POLICY_SHED:
+                self.shed += 1
+                logger.warning("Очередь webhook переполнена, апдейт выброшен")
+                return 200
+            if self._policy == POLICY_429:
+                self.rejected += 1
+                return 429
+            # Запоминаем до ожидания, чтобы повтор не встал в очередь вторым
+            self._remember(update_id)
+            await self._queue.put(item)
+
+        self._remember(update_id)
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, self._queue.qsize())
+        return 200
+
+    def _remember(self, update_id: Optional[int]) -> None:
+        """Запоминает update_id, принятый в очередь (отклонённые Telegram повторит)."""
+        if self._dedup is not None and update_id is not None:
+            self._dedup.add(update_id)
+
+    async def _consume(self) -> None:
+        """Фоновая задача: разбирает очередь и передаёт апдейты обработчику."""
+        while True:
+            received_at, data = await self._queue.get()
+            latency = time.monotonic() - received_at
+            self._latency_total += latency
+            self._latency_max = max(self._latency_max, latency)
+            try:
+                await self._handler(data)
+                self.processed += 1
+            except Exception:
+                self.failed += 1
+                logger.exception("Ошибка обработки апдейта из webhook")
+            finally:
+                self._queue.task_done()
+
+    def start(self) -> None:
+        """Запускает фоновую обработку очереди."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._consume())
+
+    async def stop(self, drain_timeout: float = 5.0) -> None:
+        """
+        Останавливает обработку, предварительно дождавшись
+        разбора очереди (не дольше drain_timeout секунд).
+        """
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Не дождались разбора очереди webhook: осталось %s", self.depth)
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Текущие метрики очереди и задержки приёма."""
+        taken = self.processed + self.failed
+        return {
+            "policy": self._policy,
+            "depth": self.depth,
+            "maxsize": self.maxsize,
+            "max_depth": self.max_depth,
+            "received": self.received,
+            "enqueued": self.enqueued,
+            "shed": self.shed,
+            "rejected": self.rejected,
+            "invalid": self.invalid,
+            "duplicates": self._dedup.duplicates if self._dedup is not None else 0,
+            "processed": self.processed,
+            "failed": self.failed,
+            "latency_avg_ms": round(self._latency_total / taken * 1000, 3) if taken else 0.0,
+            "latency_max_ms": round(self._latency_max * 1000, 3),
+        }
@@ -0,0 +1,156 @@
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional, Set
+
+# Логгер модуля
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS workers (
+    id TEXT PRIMARY KEY,
+    heartbeat REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    partition INTEGER PRIMARY KEY,
+    owner TEXT,
+    expires REAL NOT NULL DEFAULT 0
+);
+"""
+
+
+def default_worker_id() -> str:
+    """Идентификатор воркера: хост и pid процесса."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class LeaseManager:
+    """
+    Распределяет партиции напоминаний между процессами через
+    аренды с ограниченным сроком в общей SQLite-базе.
+
+    Каждый воркер периодически вызывает refresh(): продлевает свои
+    аренды, отдаёт лишние (если воркеров стало больше) и забирает
+    свободные или просроченные (если кто-то упал). Напоминание
+    обслуживает только владелец партиции uid % partitions.
+    """
+
+    def __init__(
+        self,
+        db_path: Path,
+        partitions: int = 64,
+        ttl: float = 30.0,
+        worker_id: Optional[str] = None,
+    ) -> None:
+        if partitions <= 0:
+            raise ValueError("partitions должен быть положительным")
+        self.partitions = partitions
+        self.ttl = ttl
+        self.worker_id = worker_id or default_worker_id()
+        self._owned: Set[int] = set()
+        self._valid_until = 0.0
+        self._mutex = threading.Lock()
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(
+            str(db_path), timeout=ttl, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO leases(partition, owner, expires) VALUES (?, NULL, 0)",
+            [(p,) for p in range(partitions)],
+        )
+
+    def partition_of(self, uid: int) -> int:
+        """Партиция пользователя."""
+        return uid % self.partitions
+
+    def owns(self, uid: int) -> bool:
+        """Принадлежит ли партиция пользователя этому воркеру прямо сейчас."""
+        return time.time() < self._valid_until and self.partition_of(uid) in self._owned
+
+    @property
+    def owned(self) -> Set[int]:
+        return set(self._owned) if time.time() < self._valid_until else set()
+
+    def refresh(self) -> Set[int]:
+        """
+        Продлевает аренды и перераспределяет партиции.
+        Синхронный — вызывать через asyncio.to_thread.
+        Возвращает множество партиций этого воркера.
+        """
+        with self._mutex:
+            now = time.time()
+            expires = now + self.ttl
+            me = self.worker_id
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT INTO workers(id, heartbeat) VALUES (?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET heartbeat = excluded.heartbeat",
+                    (me, now),
+                )
+                conn.execute("DELETE FROM workers WHERE heartbeat < ?", (now - self.ttl,))
+                live = conn.execute("SELECT COUNT(*) FROM workers").fetchone()[0]
+                share = -(-self.partitions // max(live, 1))
+
+                # Продлеваем только ещё живые аренды: просроченные могли забрать
+                conn.execute(
+                    "UPDATE leases SET expires = ? WHERE owner = ? AND expires >= ?",
+                    (expires, me, now),
+                )
+                owned: List[int] = [
+                    p for (p,) in conn.execute(
+                        "SELECT partition FROM leases WHERE owner = ? AND expires = ? ORDER BY partition",
+                        (me, expires),
+                    )
+                ]
+                if len(owned) > share:
+                    # Воркеров стало больше — отдаём лишнее
+                    conn.executemany(
+                        "UPDATE leases SET owner = NULL, expires = 0 WHERE partition = ?",
+                        [(p,) for p in owned[share:]],
+                    )
+                    owned = owned[:share]
+                elif len(owned) < share:
+                    # Забираем свободные и просроченные партиции
+                    free = [
+                        p for (p,) in conn.execute(
+                            "SELECT partition FROM leases WHERE owner IS NULL OR expires < ? "
+                            "ORDER BY partition LIMIT ?",
+                            (now, share - len(owned)),
+                        )
+                    ]
+                    conn.executemany(
+                        "UPDATE leases SET owner = ?, expires = ? WHERE partition = ?",
+                        [(me, expires, p) for p in free],
+                    )
+                    owned.extend(free)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+            gained = set(owned) - self._owned
+            lost = self._owned - set(owned)
+            if gained or lost:
+                logger.info(
+                    "Аренды воркера %s: %s партиций (+%s/-%s), живых воркеров %s",
+                    me, len(owned), len(gained), len(lost), live,
+                )
+            self._owned = set(owned)
+            self._valid_until = expires
+            return set(owned)
+
+    def release(self) -> None:
+        """Отдаёт все аренды воркера (при штатной остановке)."""
+        with self._mutex:
+            self._conn.execute("UPDATE leases SET owner = NULL, expires = 0 WHERE owner = ?", (self.worker_id,))
+            self._conn.execute("DELETE FROM workers WHERE id = ?", (self.worker_id,))
+            self._owned = set()
+            self._valid_until = 0.0
@@ -1,85 +1,329 @@
+import os
 import logging
-from typing import List, Dict, Any
+from typing import TYPE_CHECKING, List, Dict, Any, Awaitable, Callable, MutableMapping, Optional, Tuple
 import asyncio
-from openai import OpenAI
 
-# 1. System prompt builder
-def build_prompt(user: dict) -> str:
-    style = user.get("style", "street")
-    lang = user.get("language", "RU")
-    gender = user.get("gender", "")
-    persona = user.get("persona", {})
-    name = user.get("name", "пользователь" if lang == "RU" else "user")
+from services.profile_store import profiles
 
-    if lang == "RU":
-        gender_line = "женщина" if gender == "female" else "мужчина" if gender == "male" else "человек"
-    else:
-        gender_line = "female" if gender == "female" else "male" if gender == "male" else "person"
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+# Адрес API (например, локальная заглушка для тестов); по умолчанию — api.openai.com
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+# Таймауты запроса, секунд: общий и на установку соединения
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+# Пул HTTP-соединений: всего, держать открытыми (keep-alive) и сколько секунд
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "20"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "30"))
+# Сколько запросов к OpenAI одновременно (остальные ждут своей очереди)
+OPENAI_CONCURRENCY = int(os.getenv("OPENAI_CONCURRENCY", "50"))
+# Потоковые ответы: текст показывается по мере генерации (0 — ответ целиком)
+OPENAI_STREAM = os.getenv("OPENAI_STREAM", "1") == "1"
+# Бюджет истории в запросе, токенов (примерно): старое сворачивается в сводку
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "2000"))
+# Предел длины сводки, токенов
+HISTORY_SUMMARY_TOKENS = int(os.getenv("HISTORY_SUMMARY_TOKENS", "300"))
+# Предел хранимых сообщений, если сводка почему-то не обновляется
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", "100"))
+
+# Клиент создаётся при первом запросе к чату: импорт openai не нужен при старте
+_client: Optional["AsyncOpenAI"] = None
+_slots: Optional[asyncio.Semaphore] = None
+# Фоновые обновления сводок: user_id -> задача (не больше одной на пользователя)
+_summarizing: Dict[int, asyncio.Task] = {}
+
+
+def get_client() -> "AsyncOpenAI":
+    """
+    Вернуть общий асинхронный клиент OpenAI, импортируя библиотеку при
+    первом вызове. Запросы идут через общий пул соединений httpx с
+    keep-alive, без потоков: число одновременных чатов не ограничено
+    пулом потоков asyncio.to_thread.
+    """
+    global _client
+    if _client is None:
+        import httpx
+        from openai import AsyncOpenAI
+
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+                keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+        )
+        _client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=OPENAI_BASE_URL,
+            max_retries=OPENAI_MAX_RETRIES,
+            http_client=http_client,
+        )
+    return _client
+
+
+async def close_client() -> None:
+    """Закрывает общий клиент и его соединения (при остановке приложения)."""
+    global _client
+    if _client is not None:
+        client, _client = _client, None
+        await client.close()
 
-    traits = [f"{k}: {', '.join(v) if isinstance(v, list) else v}" for k, v in persona.items()]
-    traits.append(f"Имя: {name}" if lang == "RU" else f"Name: {name}")
-    traits.append(f"Пол: {gender_line}" if lang == "RU" else f"Gender: {gender_line}")
 
-    extra = ". ".join(traits)
+def _limit() -> asyncio.Semaphore:
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(OPENAI_CONCURRENCY)
+    return _slots
 
-    style_prompt_ru = {
+# 1. System prompt builder
+# Шаблоны стилей по языку: собираются один раз при импорте
+_STYLE_PROMPTS = {
+    "RU": {
         "street": "Ты уличный бот-бро. Говори просто, с юмором, можешь вставлять лёгкий сленг, немного неформальности. Главное — поддержка и уверенность.",
         "coach": "Ты коуч и наставник. Говоришь уверенно, мотивируешь, даёшь советы чётко и по делу.",
         "psych": "Ты психолог. Говоришь мягко, внимательно, с эмпатией. Помогаешь разобраться в чувствах, задаёшь наводящие вопросы."
-    }
-    style_prompt_en = {
+    },
+    "EN": {
         "street": "You're a street-style AI bro. Speak casually, with slang and humor. Be confident and supportive.",
         "coach": "You're a motivational coach. Speak clearly, confidently, and give concrete, action-oriented advice.",
         "psych": "You're an empathetic psychologist. Speak gently and attentively, help the user understand their emotions and thoughts."
-    }
+    },
+}
+# Подписи по языку: имя по умолчанию, шаблоны «Имя»/«Пол», пол словами
+_LABELS = {
+    "RU": ("пользователь", "Имя: {}", "Пол: {}", {"female": "женщина", "male": "мужчина"}, "человек"),
+    "EN": ("user", "Name: {}", "Gender: {}", {"female": "female", "male": "male"}, "person"),
+}
+# Начало промпта для каждой пары (язык, стиль); неизвестный стиль — пустой
+_HEADS = {(lang, style): text + " " for lang, styles in _STYLE_PROMPTS.items() for style, text in styles.items()}
+
+# Сколько готовых промптов держать в памяти (по одному на пользователя)
+PROMPT_CACHE_SIZE = int(os.getenv("PROMPT_CACHE_SIZE", "10000"))
+# Готовые промпты: user_id -> (версия профиля, промпт)
+_prompts: Dict[int, Tuple[Tuple[int, int], str]] = {}
+
+
+def build_prompt(user: dict) -> str:
+    style = user.get("style", "street")
+    lang = user.get("language", "RU")
+    gender = user.get("gender", "")
+    persona = user.get("persona", {})
+    default_name, name_tpl, gender_tpl, genders, nobody = _LABELS["RU" if lang == "RU" else "EN"]
+    name = user.get("name", default_name)
+
+    traits = [f"{k}: {', '.join(v) if isinstance(v, list) else v}" for k, v in persona.items()]
+    traits.append(name_tpl.format(name))
+    traits.append(gender_tpl.format(genders.get(gender, nobody)))
+
+    head = _HEADS.get(("RU" if lang == "RU" else "EN", style), " ")
+    return head + ". ".join(traits)
 
-    style_prompt = style_prompt_ru if lang == "RU" else style_prompt_en
-    return style_prompt.get(style, "") + " " + extra
+
+def get_prompt(user_id: int, user: dict) -> str:
+    """
+    Системный промпт пользователя из кеша. Ключ — версия профиля
+    (profiles.version): любое изменение профиля, в том числе язык,
+    стиль и пол из кнопок меню, даёт новую версию, и промпт
+    пересобирается. Между изменениями промпт побайтно тот же, что
+    позволяет провайдеру кешировать общий префикс запроса.
+    """
+    version = profiles.version(user_id)
+    cached = _prompts.get(user_id)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    prompt = build_prompt(user)
+    if cached is None and len(_prompts) >= PROMPT_CACHE_SIZE:
+        # Вытесняем самый старый
+        del _prompts[next(iter(_prompts))]
+    _prompts[user_id] = (version, prompt)
+    return prompt
 
 # 2. Format chat history for OpenAI API
-def format_chat_history(history: List[Dict[str, str]], prompt: str) -> List[Dict[str, str]]:
+# Сводка старых сообщений хранится первым элементом истории с этой ролью
+SUMMARY_ROLE = "summary"
+
+# Инструкция для сводки и подпись перед ней в запросе
+_SUMMARY_TEXTS = {
+    "RU": (
+        "Сожми разговор ниже в короткую сводку для его продолжения: факты о пользователе, "
+        "его планы и просьбы, договорённости, незакрытые вопросы. До {n} слов, по-русски, без вступлений.",
+        "Ранее в разговоре: ",
+    ),
+    "EN": (
+        "Condense the conversation below into a short summary for continuing it: facts about the user, "
+        "their plans and requests, agreements, open questions. Up to {n} words, no preamble.",
+        "Earlier in the conversation: ",
+    ),
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Примерное число токенов сообщения без токенизатора: латиница ~4
+    символа на токен, остальное (кириллица и т.п.) ~2, плюс служебные.
+    """
+    return (len(text) >> 2 if text.isascii() else len(text) >> 1) + 4
+
+
+def _summary_end(history: List[Dict[str, str]]) -> int:
+    """Индекс первого обычного сообщения (1, если в начале сводка)."""
+    return 1 if history and history[0].get("role") == SUMMARY_ROLE else 0
+
+
+def format_chat_history(
+    history: List[Dict[str, str]], prompt: str, budget: int = HISTORY_TOKEN_BUDGET
+) -> List[Dict[str, str]]:
     """
     Формирует массив сообщений для OpenAI API:
     - prompt (system)
-    - history[-12:]
+    - сводка старых сообщений (system), если есть
+    - последние сообщения, сколько влезает в budget токенов
+      (последнее — всегда)
     """
     chat = [{"role": "system", "content": prompt}]
-    chat.extend(history[-12:])  # Берём только последние 12
+    start = _summary_end(history)
+    if start:
+        chat.append({"role": "system", "content": history[0]["content"]})
+    used = 0
+    first = len(history)
+    while first > start:
+        cost = estimate_tokens(history[first - 1]["content"])
+        if used + cost > budget and first < len(history):
+            break
+        used += cost
+        first -= 1
+    chat.extend(history[first:])
     return chat
 
+
+def _schedule_summary(
+    user_id: int,
+    user_ctx: MutableMapping[int, List[Dict[str, str]]],
+    history: List[Dict[str, str]],
+    client: "AsyncOpenAI",
+    model: str,
+    lang: str,
+) -> None:
+    """
+    Если история вышла за бюджет, в фоне сворачивает старые сообщения
+    (вместе с прежней сводкой) в новую сводку; свежие сообщения
+    примерно на половину бюджета остаются как есть.
+    """
+    if user_id in _summarizing:
+        return
+    start = _summary_end(history)
+    costs = [estimate_tokens(m["content"]) for m in history[start:]]
+    if sum(costs) <= HISTORY_TOKEN_BUDGET:
+        return
+    keep, kept = 1, costs[-1]
+    while keep < len(costs) and kept + costs[-keep - 1] <= HISTORY_TOKEN_BUDGET // 2:
+        keep += 1
+        kept += costs[-keep]
+    fold = history[:len(history) - keep]
+    if len(fold) <= start:
+        return
+    task = asyncio.create_task(_summarize(user_id, user_ctx, fold, client, model, lang))
+    _summarizing[user_id] = task
+    task.add_done_callback(lambda _: _summarizing.pop(user_id, None))
+
+
+async def _summarize(
+    user_id: int,
+    user_ctx: MutableMapping[int, List[Dict[str, str]]],
+    fold: List[Dict[str, str]],
+    client: "AsyncOpenAI",
+    model: str,
+    lang: str,
+) -> None:
+    """Заменяет начало истории fold одной сводкой, если оно не изменилось."""
+    instructions, label = _SUMMARY_TEXTS["RU" if lang == "RU" else "EN"]
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in fold)
+    try:
+        async with _limit():
+            response = await client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": instructions.format(n=HISTORY_SUMMARY_TOKENS // 2)},
+                    {"role": "user", "content": transcript},
+                ],
+                max_tokens=HISTORY_SUMMARY_TOKENS,
+            )
+        summary = (response.choices[0].message.content or "").strip()
+    except Exception as e:
+        logging.error(f"OpenAI summary error for user {user_id}: {e}")
+        return
+    if not summary:
+        return
+    history = user_ctx.get(user_id)
+    if history is None or history[:len(fold)] != fold:
+        # История сброшена или обрезана, пока писалась сводка
+        return
+    # Тот же список: ответ, который сейчас пишется, допишется после сводки
+    history[:len(fold)] = [{"role": SUMMARY_ROLE, "content": label + summary}]
+    user_ctx[user_id] = history
+    logging.info(f"History summary for user {user_id}: folded {len(fold)} messages")
+
 # 3. Общение с OpenAI
 async def ask_openai(
     user_id: int,
     message: str,
-    user_ctx: Dict[int, List[Dict[str, str]]],
+    user_ctx: MutableMapping[int, List[Dict[str, str]]],
     user_data: Dict[str, dict],
-    client: OpenAI,
-    model: str = "gpt-3.5-turbo"
+    client: "AsyncOpenAI",
+    model: str = "gpt-3.5-turbo",
+    on_partial: Optional[Callable[[str], Awaitable[None]]] = None,
 ) -> str:
     """
-    Получить ответ от OpenAI. Обновляет историю сообщений user_ctx для user_id.
+    Получить ответ от OpenAI. Обновляет историю сообщений user_ctx для user_id;
+    в запрос идёт сводка и свежие сообщения в пределах HISTORY_TOKEN_BUDGET.
+
+    С on_partial ответ запрашивается потоком, и on_partial получает
+    каждый пришедший фрагмент; в историю попадает только полный ответ.
     """
     # Готовим user info и prompt
     user = user_data.get(str(user_id), {})
-    prompt = build_prompt(user)
+    prompt = get_prompt(user_id, user)
     chat_history = user_ctx.setdefault(user_id, [])
     chat_history.append({"role": "user", "content": message})
     # Готовим messages для OpenAI
     messages = format_chat_history(chat_history, prompt)
 
     try:
-        # Новый OpenAI API (>=1.14.3)
-        response = await asyncio.to_thread(
-            client.chat.completions.create,
-            model=model,
-            messages=messages,
-        )
-        reply = response.choices[0].message.content.strip()
+        # Асинхронный клиент: ожидание ответа не занимает поток
+        async with _limit():
+            if on_partial is None:
+                response = await client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                )
+                reply = response.choices[0].message.content.strip()
+            else:
+                stream = await client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    stream=True,
+                )
+                parts: List[str] = []
+                async for chunk in stream:
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        parts.append(delta)
+                        await on_partial(delta)
+                reply = "".join(parts).strip()
         logging.info(f"OpenAI reply for user {user_id}: {reply[:60]}...")
     except Exception as e:
         logging.error(f"OpenAI Error for user {user_id}: {e}")
         reply = "Ошибка. Попробуй ещё или /start."
     # Добавляем ответ ассистента в историю
     chat_history.append({"role": "assistant", "content": reply})
-    user_ctx[user_id] = chat_history[-12:]
+    start = _summary_end(chat_history)
+    excess = len(chat_history) - start - HISTORY_MAX_MESSAGES
+    if excess > 0:
+        del chat_history[start:start + excess]
+    user_ctx[user_id] = chat_history
+    _schedule_summary(user_id, user_ctx, chat_history, client, model, user.get("language", "RU"))
     return reply
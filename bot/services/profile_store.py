@@ -0,0 +1,127 @@
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, Mapping, MutableMapping, Optional, Tuple
+
+from utils.json_utils import safe_load_json, async_save_json, async_save_file, pending_save
+from services.snapshot import ProfileSnapshot, SnapshotError, write_profiles
+
+# Логгер модуля
+logger = logging.getLogger(__name__)
+
+# Путь к профилям пользователей
+DATA_DIR = Path(__file__).parent.parent / "data"
+USER_JSON_PATH = DATA_DIR / "user_data.json"
+USER_SNAPSHOT_PATH = DATA_DIR / "user_data.snap"
+# Формат хранения профилей: json (по умолчанию) или snapshot (бинарный снимок)
+PROFILE_STORAGE = os.getenv("PROFILE_STORAGE", "json").lower()
+
+_EMPTY: Dict[str, Any] = {}
+
+
+class ProfileStore:
+    """
+    Профили пользователей (язык, стиль, пол, ...) в памяти.
+    Читаются с диска один раз; изменения сразу пишутся через
+    отложенную запись json_utils. Горячий путь (get) диск не трогает.
+
+    В режиме snapshot профили читаются из бинарного снимка лениво
+    (mmap, разбор при обращении); при первом изменении копируются в dict.
+    """
+
+    def __init__(self, path: Path = USER_JSON_PATH, snapshot_path: Optional[Path] = None) -> None:
+        self.path = path
+        self.snapshot_path = snapshot_path
+        self._profiles: MutableMapping[str, Dict[str, Any]] = {}
+        # Есть изменения с последней записи (файл пишется целиком)
+        self._dirty = False
+        # Версии профилей для кешей производных данных (промпт и т.п.):
+        # номер загрузки с диска и счётчик изменений пользователя
+        self._generation = 0
+        self._versions: Dict[str, int] = {}
+        self.reload()
+
+    def reload(self) -> None:
+        """Перечитывает профили с диска."""
+        self._dirty = False
+        self._generation += 1
+        self._versions.clear()
+        if self.snapshot_path is not None:
+            pending = pending_save(str(self.snapshot_path))
+            if pending is not None:
+                self._profiles = pending
+                return
+            if self.snapshot_path.exists():
+                try:
+                    self._profiles = ProfileSnapshot(self.snapshot_path)
+                    return
+                except (SnapshotError, OSError):
+                    logger.exception("Не удалось открыть снимок %s", self.snapshot_path)
+            # Снимка ещё нет — берём JSON, снимок запишется при первом изменении
+        data = safe_load_json(str(self.path), {})
+        self._profiles = data if isinstance(data, dict) else {}
+
+    def _writable(self) -> Dict[str, Dict[str, Any]]:
+        """Профили как изменяемый dict (снимок копируется один раз)."""
+        if not isinstance(self._profiles, dict):
+            self._profiles = {uid: self._profiles[uid] for uid in self._profiles}
+        return self._profiles
+
+    @property
+    def data(self) -> Mapping[str, Dict[str, Any]]:
+        """Все профили: {str(uid): профиль}. Только для чтения."""
+        return self._profiles
+
+    def get(self, uid: int) -> Dict[str, Any]:
+        """Профиль пользователя (пустой, если его нет). Не изменять."""
+        return self._profiles.get(str(uid), _EMPTY)
+
+    def version(self, uid: int) -> Tuple[int, int]:
+        """Версия профиля: меняется при каждом его изменении и перечитывании."""
+        return self._generation, self._versions.get(str(uid), 0)
+
+    def _touch(self, sid: str) -> None:
+        self._versions[sid] = self._versions.get(sid, 0) + 1
+        self._dirty = True
+
+    async def update(self, uid: int, **fields: Any) -> None:
+        """
+        Меняет поля профиля; поле со значением None удаляется.
+        Запись на диск — только если что-то действительно изменилось.
+        """
+        sid = str(uid)
+        profiles = self._writable()
+        profile = profiles.get(sid, {})
+        changed = dict(profile)
+        for key, value in fields.items():
+            if value is None:
+                changed.pop(key, None)
+            else:
+                changed[key] = value
+        if changed == profile and sid in profiles:
+            return
+        profiles[sid] = changed
+        self._touch(sid)
+        await self.flush()
+
+    async def clear(self, uid: int) -> None:
+        """Удаляет профиль пользователя."""
+        sid = str(uid)
+        if self._writable().pop(sid, None) is not None:
+            self._touch(sid)
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Ставит профили на запись, если есть изменения."""
+        if not self._dirty:
+            return
+        logger.info("Сохраняю профили")
+        self._dirty = False
+        if self.snapshot_path is not None:
+            await async_save_file(str(self.snapshot_path), self._profiles, write_profiles)
+        else:
+            await async_save_json(str(self.path), self._profiles)
+
+
+# Общий экземпляр на процесс
+profiles = ProfileStore(snapshot_path=USER_SNAPSHOT_PATH if PROFILE_STORAGE == "snapshot" else None)
@@ -0,0 +1,178 @@
+"""
+Правила повторения напоминаний. Серия хранится одной записью с правилом,
+следующее срабатывание вычисляется только когда наступило предыдущее.
+
+Формат правила (строка в хранилище):
+    every <секунды>                     — через равные интервалы
+    cron <мин> <час> <день> <мес> <дн>  — как в crontab (дн: 0 — воскресенье)
+    ... @<часовой пояс>                 — пояс для cron (по умолчанию REMINDER_TZ)
+
+daily/weekly при разборе сводятся к cron:
+    daily 09:00            -> cron 0 9 * * *
+    weekly mon,thu 09:00   -> cron 0 9 * * 1,4
+"""
+import os
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import FrozenSet, Iterable, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+# Часовой пояс правил по умолчанию
+REMINDER_TZ = os.getenv("REMINDER_TZ", "UTC")
+
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+# (минимум, максимум) для полей cron
+_BOUNDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+# Сколько дней вперёд искать совпадение cron (29 февраля бывает раз в 4 года)
+_MAX_DAYS = 366 * 5
+
+
+def _field(text: str, low: int, high: int) -> Tuple[FrozenSet[int], bool]:
+    """Поле cron -> (множество значений, ограничено ли поле)."""
+    values = set()
+    for part in text.split(","):
+        body, _, step = part.partition("/")
+        if body == "*":
+            start, end = low, high
+        elif "-" in body:
+            a, b = body.split("-", 1)
+            start, end = int(a), int(b)
+        else:
+            start = end = int(body)
+            if step:
+                end = high
+        stride = int(step) if step else 1
+        if stride <= 0 or start < low or end > high or start > end:
+            raise ValueError(f"Некорректное поле cron: {text}")
+        values.update(range(start, end + 1, stride))
+    return frozenset(values), text != "*"
+
+
+class RecurrenceRule:
+    """
+    Разобранное правило повторения. next_after() даёт ближайшее
+    срабатывание после заданного момента (секунды epoch).
+    """
+
+    __slots__ = ("spec", "interval", "tz", "_minutes", "_hours", "_days", "_months", "_weekdays", "_dom_any", "_dow_any")
+
+    def __init__(self, spec: str) -> None:
+        self.spec = spec
+        self.interval: Optional[int] = None
+        self.tz: Optional[ZoneInfo] = None
+        body, _, tz = spec.partition("@")
+        words = body.split()
+        if not words:
+            raise ValueError("Пустое правило повторения")
+        if words[0] == "every" and len(words) == 2:
+            self.interval = int(words[1])
+            if self.interval < 60:
+                raise ValueError("Интервал повторения меньше минуты")
+            return
+        if words[0] != "cron" or len(words) != 6:
+            raise ValueError(f"Неизвестное правило повторения: {spec}")
+        tz = tz.strip() or REMINDER_TZ
+        try:
+            self.tz = ZoneInfo(tz)
+        except ZoneInfoNotFoundError:
+            raise ValueError(f"Неизвестный часовой пояс: {tz}")
+        # Пояс фиксируется в записи: смена REMINDER_TZ не сдвигает старые серии
+        self.spec = f"{' '.join(words)} @{tz}"
+        fields = [_field(w, lo, hi) for w, (lo, hi) in zip(words[1:], _BOUNDS)]
+        (self._minutes, _), (self._hours, _), (self._days, dom), (self._months, _), (dows, dow) = fields
+        # 7 — тоже воскресенье
+        self._weekdays = frozenset(d % 7 for d in dows)
+        self._dom_any, self._dow_any = not dom, not dow
+
+    def __str__(self) -> str:
+        return self.spec
+
+    def __repr__(self) -> str:
+        return f"RecurrenceRule({self.spec!r})"
+
+    def _day_ok(self, day: date) -> bool:
+        if day.month not in self._months:
+            return False
+        dom_ok = day.day in self._days
+        dow_ok = (day.weekday() + 1) % 7 in self._weekdays
+        # Как в cron: если ограничены и день месяца, и день недели — достаточно любого
+        if self._dom_any:
+            return dow_ok
+        if self._dow_any:
+            return dom_ok
+        return dom_ok or dow_ok
+
+    def _next_cron(self, after: float) -> int:
+        start = datetime.fromtimestamp(after, self.tz).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day, first = start.date(), start.hour * 60 + start.minute
+        hours, minutes = sorted(self._hours), sorted(self._minutes)
+        for _ in range(_MAX_DAYS):
+            if self._day_ok(day):
+                for h in hours:
+                    for m in minutes:
+                        if h * 60 + m < first:
+                            continue
+                        ts = int(datetime(day.year, day.month, day.day, h, m, tzinfo=self.tz).timestamp())
+                        if ts > after:
+                            return ts
+            day += timedelta(days=1)
+            first = 0
+        raise ValueError(f"Правило {self.spec} не срабатывает")
+
+    def next_after(self, after: float, prev: Optional[int] = None) -> int:
+        """
+        Ближайшее срабатывание строго после after. Для интервала шаг
+        отсчитывается от prev (предыдущего срабатывания), если он задан.
+        """
+        if self.interval is not None:
+            if prev is None:
+                return int(after) + self.interval
+            steps = max(1, int((after - prev) // self.interval) + 1)
+            return prev + steps * self.interval
+        return self._next_cron(after)
+
+    @classmethod
+    def every(cls, seconds: int) -> "RecurrenceRule":
+        return cls(f"every {int(seconds)}")
+
+    @classmethod
+    def cron(cls, expr: str, tz: Optional[str] = None) -> "RecurrenceRule":
+        return cls(f"cron {expr} @{tz or REMINDER_TZ}")
+
+    @classmethod
+    def daily(cls, hour: int, minute: int = 0, tz: Optional[str] = None) -> "RecurrenceRule":
+        return cls.cron(f"{minute} {hour} * * *", tz)
+
+    @classmethod
+    def weekly(cls, weekdays: Iterable[int], hour: int, minute: int = 0, tz: Optional[str] = None) -> "RecurrenceRule":
+        """weekdays: 0 — понедельник ... 6 — воскресенье."""
+        days = ",".join(str((d + 1) % 7) for d in sorted(set(weekdays)))
+        return cls.cron(f"{minute} {hour} * * {days}", tz)
+
+
+def format_local(at: datetime, fmt: str = "%d.%m.%Y %H:%M", tz: Optional[ZoneInfo] = None) -> str:
+    """Время для показа пользователю: в поясе tz (по умолчанию REMINDER_TZ), а не в UTC."""
+    return at.astimezone(tz or ZoneInfo(REMINDER_TZ)).strftime(fmt)
+
+
+def _hm(text: str) -> Tuple[int, int]:
+    h, _, m = text.partition(":")
+    return int(h), int(m or 0)
+
+
+@lru_cache(maxsize=1024)
+def parse_rule(text: str) -> RecurrenceRule:
+    """
+    Разбирает правило из хранилища или короткую запись
+    (daily 09:00, weekly mon,thu 09:00). Правила кешируются.
+    """
+    body, _, tz = text.strip().partition("@")
+    tz = tz.strip() or None
+    words = body.split()
+    if words and words[0] == "daily" and len(words) == 2:
+        return RecurrenceRule.daily(*_hm(words[1]), tz=tz)
+    if words and words[0] == "weekly" and len(words) == 3:
+        days: List[int] = [WEEKDAYS.index(d[:3].lower()) for d in words[1].split(",")]
+        return RecurrenceRule.weekly(days, *_hm(words[2]), tz=tz)
+    return RecurrenceRule(text.strip())
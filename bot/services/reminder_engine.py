@@ -0,0 +1,209 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from services.reminder_store import Reminder, ReminderKey, ReminderRegistry
+
+# Логгер модуля
+logger = logging.getLogger(__name__)
+
+# Горизонт: сколько секунд вперёд напоминания держатся в памяти планировщика
+REMINDER_HORIZON = float(os.getenv("REMINDER_HORIZON", "600"))
+# Максимальная пауза тикера (чаще — если ближайшее напоминание раньше)
+REMINDER_TICK = float(os.getenv("REMINDER_TICK", "1.0"))
+# Пропущенные (простой, перезапуск) не старше окна отправляются с ограниченной скоростью
+REMINDER_CATCHUP_GRACE = float(os.getenv("REMINDER_CATCHUP_GRACE", "3600"))
+REMINDER_CATCHUP_RATE = float(os.getenv("REMINDER_CATCHUP_RATE", "5"))
+
+# Опоздание, после которого напоминание считается пропущенным, секунд
+_LATE = 5.0
+
+FireCallback = Callable[[Reminder], Awaitable[None]]
+ExpiredCallback = Callable[[List[Reminder]], Awaitable[None]]
+
+
+class HorizonScheduler:
+    """
+    Планировщик напоминаний с горизонтом: вместо задачи JobQueue на
+    каждое напоминание один тикер берёт из кучи реестра (pop_due) только
+    то, что наступит в ближайшие horizon секунд, и держит это в своей
+    маленькой куче. Остальное лежит в реестре/хранилище и подтягивается
+    по мере сдвига горизонта.
+
+    Удалённые из реестра напоминания отбрасываются при срабатывании.
+    wake() будит тикер (например, после добавления напоминания).
+
+    Напоминания, опоздавшие к моменту взятия из реестра (бот не работал),
+    идут в очередь догона: не старше grace — отправляются по одному
+    со скоростью catchup_rate в секунду, более старые передаются в
+    on_expired.
+    """
+
+    def __init__(
+        self,
+        registry: ReminderRegistry,
+        fire: FireCallback,
+        horizon: float = REMINDER_HORIZON,
+        tick: float = REMINDER_TICK,
+        grace: float = REMINDER_CATCHUP_GRACE,
+        catchup_rate: float = REMINDER_CATCHUP_RATE,
+        on_expired: Optional[ExpiredCallback] = None,
+    ) -> None:
+        self.registry = registry
+        self.fire = fire
+        self.horizon = horizon
+        self.tick = tick
+        self.grace = grace
+        self.catchup_rate = catchup_rate
+        self.on_expired = on_expired
+        self._catchup: Deque[Reminder] = deque()
+        self._catchup_ready = asyncio.Event()
+        self._catchup_task: Optional[asyncio.Task] = None
+        self.expired = 0
+        # (время, порядковый номер, напоминание) в пределах горизонта
+        self._near: List[Tuple[int, int, Reminder]] = []
+        self._seq = itertools.count()
+        # Ключи в _near и отправляемые сейчас: не берём их повторно после reload()
+        self._queued: Dict[ReminderKey, int] = {}
+        # Отправляемые сейчас: ключ -> время (серия может уже стоять на следующем)
+        self._inflight: Dict[ReminderKey, int] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._wake = asyncio.Event()
+        self._ticker: Optional[asyncio.Task] = None
+        self.fired = 0
+
+    def wake(self) -> None:
+        """Подтянуть горизонт и проверить сроки без ожидания тика."""
+        self._wake.set()
+
+    def resync(self) -> None:
+        """
+        Сбрасывает ближнюю кучу: после reload() реестра всё заново
+        берётся из его кучи (отправляемые сейчас пропускаются).
+        """
+        self._near = []
+        self._queued.clear()
+        self._catchup.clear()
+        self.wake()
+
+    def _pull(self, now: float) -> None:
+        """
+        Переносит из реестра напоминания, наступающие до now + horizon;
+        опоздавшие — в очередь догона или в просроченные.
+        """
+        limit = datetime.fromtimestamp(now + self.horizon, timezone.utc)
+        expired: List[Reminder] = []
+        for r in self.registry.pop_due(limit):
+            if self._inflight.get(r.key) == r.ts or self._queued.get(r.key) == r.ts:
+                continue
+            if r.ts < now - self.grace:
+                expired.append(r)
+                continue
+            self._queued[r.key] = r.ts
+            if r.ts < now - _LATE:
+                self._catchup.append(r)
+                self._catchup_ready.set()
+            else:
+                heapq.heappush(self._near, (r.ts, next(self._seq), r))
+        if expired:
+            self.expired += len(expired)
+            logger.warning("Просрочено больше чем на %s с: %s напоминаний", self.grace, len(expired))
+            if self.on_expired is not None:
+                self._spawn(self.on_expired(expired))
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _launch(self, r: Reminder) -> None:
+        self._inflight[r.key] = r.ts
+        self.fired += 1
+        self._spawn(self._run_one(r))
+
+    async def _drain_catchup(self) -> None:
+        """Отправляет пропущенные напоминания не быстрее catchup_rate в секунду."""
+        while True:
+            if not self._catchup:
+                self._catchup_ready.clear()
+                await self._catchup_ready.wait()
+                continue
+            r = self._catchup.popleft()
+            if self._queued.get(r.key) == r.ts:
+                del self._queued[r.key]
+            if not self.registry.live(r) or self._inflight.get(r.key) == r.ts:
+                continue
+            self._launch(r)
+            await asyncio.sleep(1 / self.catchup_rate)
+
+    def _due(self, now: float) -> List[Reminder]:
+        """Извлекает наступившие напоминания, ещё живые в реестре."""
+        due: List[Reminder] = []
+        while self._near and self._near[0][0] <= now:
+            _, _, r = heapq.heappop(self._near)
+            if self._queued.get(r.key) == r.ts:
+                del self._queued[r.key]
+            if self.registry.live(r):
+                due.append(r)
+        return due
+
+    async def _run_one(self, r: Reminder) -> None:
+        try:
+            await self.fire(r)
+        except Exception:
+            logger.exception("Ошибка отправки напоминания %s", r.id)
+        finally:
+            if self._inflight.get(r.key) == r.ts:
+                del self._inflight[r.key]
+
+    def _sleep_for(self, now: float) -> float:
+        if self._near:
+            return max(0.0, min(self.tick, self._near[0][0] - now))
+        return self.tick
+
+    async def _run(self) -> None:
+        while True:
+            now = time.time()
+            self._pull(now)
+            for r in self._due(now):
+                self._launch(r)
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self._sleep_for(time.time()))
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        """Запускает тикер (в работающем цикле событий)."""
+        if self._ticker is None:
+            self._ticker = asyncio.create_task(self._run())
+            self._catchup_task = asyncio.create_task(self._drain_catchup())
+
+    async def stop(self) -> None:
+        """Останавливает тикер и дожидается начатых отправок."""
+        for task in (self._ticker, self._catchup_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._ticker = self._catchup_task = None
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def stats(self) -> Dict[str, int]:
+        """Метрики планировщика."""
+        return {
+            "near": len(self._near),
+            "catchup": len(self._catchup),
+            "inflight": len(self._inflight),
+            "fired": self.fired,
+            "expired": self.expired,
+        }
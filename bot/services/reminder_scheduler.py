@@ -1,154 +1,259 @@
-from pathlib import Path
-import json
-from dataclasses import dataclass
-from datetime import datetime, timedelta, timezone
+import asyncio
+import os
 import logging
-from typing import Any, Dict, List, Optional
+import time
+from typing import List, Optional
 
-from telegram import Update
-from telegram.ext import Application, ContextTypes, JobQueue, Job
+from telegram.ext import Application, ContextTypes
 
 from utils.lang import get_lang, T
-from utils.json_utils import safe_load_json, async_save_json
+from services.delivery import DELIVERED, FAILED, DeliveryPipeline
+from services.digest import REMINDER_DIGEST_WINDOW, DigestCoalescer
+from services.leases import LeaseManager
+from services.recurrence import format_local, parse_rule
+from services.reminder_engine import HorizonScheduler
+from services.reminder_store import DATA_DIR, Reminder, get_registry
 
 # Логгер модуля
 logger = logging.getLogger(__name__)
 
-# Путь к файлу напоминаний и создание директории
-REMINDERS_FILE = Path(__file__).parent.parent / "data" / "reminders.json"
-REMINDERS_FILE.parent.mkdir(parents=True, exist_ok=True)
-
-@dataclass
-class Reminder:
-    id: str
-    uid: int
-    at: datetime
-    msg: str
-
-    @classmethod
-    def from_dict(cls, data: Dict[str, Any]) -> "Reminder":
-        return cls(
-            id=data["id"],
-            uid=data["uid"],
-            at=datetime.fromisoformat(data["at"]),
-            msg=data["msg"],
-        )
-
-    def to_dict(self) -> Dict[str, Any]:
-        return {
-            "id": self.id,
-            "uid": self.uid,
-            "at": self.at.isoformat(),
-            "msg": self.msg,
-        }
+# Режим нескольких воркеров: напоминания делятся между процессами арендами
+REMINDER_LEASES = os.getenv("REMINDER_LEASES", "").lower() in ("1", "true", "yes")
+LEASE_DB_FILE = DATA_DIR / "leases.db"
+LEASE_PARTITIONS = int(os.getenv("REMINDER_LEASE_PARTITIONS", "64"))
+LEASE_TTL = float(os.getenv("REMINDER_LEASE_TTL", "30"))
+# Сколько при остановке ждать начатых отправок, секунд
+REMINDER_SHUTDOWN_TIMEOUT = float(os.getenv("REMINDER_SHUTDOWN_TIMEOUT", "10"))
 
 
-def load_reminders() -> List[Reminder]:
+async def deliver_reminder(application: Application, reminder: Reminder) -> None:
     """
-    Загрузить все напоминания из файла. Возвращает список Reminder или пустой список при ошибке.
+    Отправить одно напоминание и удалить его из хранилища
+    (повторяющееся — переставить на следующее срабатывание).
     """
-    try:
-        raw = safe_load_json(str(REMINDERS_FILE), [])
-        if not isinstance(raw, list):
-            logger.error("Неверный формат reminders.json, ожидается список")
-            return []
-        reminders: List[Reminder] = []
-        for item in raw:
-            try:
-                reminders.append(Reminder.from_dict(item))
-            except Exception:
-                logger.exception("Не удалось распарсить напоминание: %s", item)
-        return reminders
-    except Exception:
-        logger.exception("Ошибка при загрузке reminders.json")
-        return []
+    leases: Optional[LeaseManager] = application.bot_data.get("reminder_leases")
+    if leases is not None and not leases.owns(reminder.uid):
+        # Партиция не наша — напоминание отправит её владелец
+        logger.info("Напоминание %s пропущено: партиция не наша", reminder.id)
+        return
+    digest = get_digest(application)
+    if digest is not None:
+        # Наступившие в пределах окна напоминания пользователя уходят одной сводкой
+        status = await digest.add(reminder.uid, reminder)
+    else:
+        status = await _send_reminders(application, reminder.uid, [reminder])
+    if status == FAILED:
+        # Остаётся в хранилище: будет отправлено после перезапуска
+        logger.error("Напоминание %s не доставлено, оставлено в хранилище", reminder.id)
+        return
+    logger.info("Напоминание %s для user=%s: %s", reminder.id, reminder.uid, status)
+    if status == DELIVERED and reminder.rule and await _advance(application, reminder):
+        return
+    # Удаляем только подтверждённое (или недоставляемое в принципе) напоминание;
+    # удаления копятся и применяются к хранилищу пачкой
+    get_registry(application).ack(reminder)
+
 
-async def save_reminders(reminders: List[Reminder]) -> bool:
+async def _advance(application: Application, reminder: Reminder) -> bool:
     """
-    Асинхронно сохранить напоминания в файл. Возвращает True при успехе.
+    Переставляет повторяющееся напоминание на следующее срабатывание
+    (та же запись, новое время). False — серии больше нет: её удалили
+    или правило не даёт следующего срабатывания.
     """
+    registry = get_registry(application)
+    if not registry.live(reminder):
+        # Серию удалили или изменили, пока шла отправка
+        return False
     try:
-        data = [r.to_dict() for r in reminders]
-        REMINDERS_FILE.parent.mkdir(parents=True, exist_ok=True)
-        await async_save_json(str(REMINDERS_FILE), data)
-        return True
-    except (OSError, ValueError):
-        logger.exception("Ошибка при сохранении reminders.json")
+        next_ts = parse_rule(reminder.rule).next_after(time.time(), prev=reminder.ts)
+    except ValueError:
+        logger.warning("Серия %s завершена: правило %r не даёт следующего срабатывания", reminder.id, reminder.rule)
         return False
+    nxt = Reminder.from_ts(reminder.key, reminder.uid, next_ts, reminder.msg, reminder.rule)
+    return await registry.add(nxt)
+
 
-async def send_reminder(context: ContextTypes.DEFAULT_TYPE) -> None:
+async def _send_reminders(application: Application, uid: int, reminders: List[Reminder]) -> str:
     """
-    Отправить одно напоминание и удалить его из хранилища.
+    Отправляет пользователю одно напоминание или сводку из нескольких
+    одним сообщением. Возвращает итог доставки.
     """
-    reminder: Reminder = context.job.data["reminder"]
-    lang = get_lang(reminder.uid)
-    text = T[lang]["reminder_alert"].format(m=reminder.msg)
+    t = T[get_lang(uid)]
+    if len(reminders) == 1:
+        text = t["reminder_alert"].format(m=reminders[0].msg)
+    else:
+        items = "\n".join(
+            t["reminder_digest_item"].format(t=format_local(r.at, "%H:%M"), m=r.msg)
+            for r in sorted(reminders, key=lambda r: r.ts)
+        )
+        text = t["reminder_digest"].format(n=len(reminders), items=items)
+    return await get_pipeline(application).deliver(
+        uid,
+        lambda: application.bot.send_message(chat_id=uid, text=text),
+    )
 
-    try:
-        await context.bot.send_message(chat_id=reminder.uid, text=text)
-        logger.info("Отправлено напоминание %s для user=%s", reminder.id, reminder.uid)
-    except Exception:
-        logger.exception("Ошибка отправки напоминания %s для %s", reminder.id, reminder.uid)
 
-    # Удаляем отправленное напоминание
-    reminders = load_reminders()
-    reminders = [r for r in reminders if r.id != reminder.id]
-    context.application.bot_data["reminders"] = reminders
-    await save_reminders(reminders)
+def get_digest(application: Application) -> Optional[DigestCoalescer]:
+    """
+    Сборщик сводок приложения (bot_data["reminder_digest"]); None,
+    если сводки выключены (REMINDER_DIGEST_WINDOW=0).
+    """
+    if REMINDER_DIGEST_WINDOW <= 0:
+        return None
+    digest = application.bot_data.get("reminder_digest")
+    if digest is None:
+        digest = DigestCoalescer(
+            lambda uid, reminders: _send_reminders(application, uid, reminders),
+            size=lambda r: len(r.msg) + 8,
+        )
+        application.bot_data["reminder_digest"] = digest
+    return digest
 
 
-def schedule_reminder(
-    reminder: Reminder,
-    job_queue: JobQueue
-) -> Optional[Job]:
+def get_pipeline(application: Application) -> DeliveryPipeline:
     """
-    Запланировать одно напоминание. Возвращает Job или None.
+    Конвейер доставки приложения (bot_data["delivery_pipeline"]),
+    создаётся при первом обращении.
     """
-    delay = (reminder.at - datetime.now(timezone.utc)).total_seconds()
-    if delay <= 0:
-        logger.info("Пропущено устаревшее напоминание %s", reminder.id)
-        return None
-    try:
-        job = job_queue.run_once(
-            send_reminder,
-            when=delay,
-            chat_id=reminder.uid,
-            data={"reminder": reminder},
-            name=f"reminder_{reminder.id}"
+    pipeline = application.bot_data.get("delivery_pipeline")
+    if pipeline is None:
+        pipeline = DeliveryPipeline()
+        application.bot_data["delivery_pipeline"] = pipeline
+    return pipeline
+
+
+def get_engine(application: Application) -> HorizonScheduler:
+    """
+    Планировщик напоминаний приложения (bot_data["reminder_engine"]),
+    создаётся при первом обращении.
+    """
+    engine = application.bot_data.get("reminder_engine")
+    if engine is None:
+        registry = get_registry(application)
+        engine = HorizonScheduler(
+            registry,
+            lambda r: deliver_reminder(application, r),
+            on_expired=lambda expired: _drop_expired(application, expired),
         )
-        logger.info("Запланировано напоминание %s на %s", reminder.id, reminder.at)
-        return job
-    except Exception:
-        logger.exception("Не удалось запланировать напоминание %s", reminder.id)
-        return None
+        application.bot_data["reminder_engine"] = engine
+        # Новое напоминание может попасть в горизонт — будим тикер
+        registry.on_add = lambda reminder: engine.wake()
+    return engine
+
+
+async def _drop_expired(application: Application, expired: List[Reminder]) -> None:
+    """
+    Удаляет напоминания, пропущенные дольше окна догона (только своих
+    партиций). Повторяющиеся не удаляются, а переходят к следующему срабатыванию.
+    """
+    leases: Optional[LeaseManager] = application.bot_data.get("reminder_leases")
+    own = [r for r in expired if leases is None or leases.owns(r.uid)]
+    dropped = []
+    for r in own:
+        if r.rule and await _advance(application, r):
+            logger.warning("Серия %s для user=%s: пропущено срабатывание %s", r.id, r.uid, r.at.isoformat())
+            continue
+        logger.warning("Напоминание %s для user=%s на %s просрочено, удалено", r.id, r.uid, r.at.isoformat())
+        dropped.append(r.id)
+    if dropped:
+        await get_registry(application).delete(dropped)
+
 
 async def _startup(context: ContextTypes.DEFAULT_TYPE) -> None:
     """
-    При запуске бота: загружает напоминания, удаляет просроченные, сохраняет и планирует оставшиеся.
+    При запуске бота: доприменяет подтверждения отправки, запускает
+    тикер и загружает напоминания порциями (тикер работает уже во время
+    загрузки). Пропущенные за время простоя уходят в очередь догона.
     """
     application: Application = context.application
-    job_queue: JobQueue = application.job_queue
+    registry = get_registry(application, load=False)
+    engine = get_engine(application)
+    # Отправленные до падения, но не удалённые из хранилища — удаляем
+    await registry.recover_acks()
 
-    all_rems = load_reminders()
-    # Фильтруем будущие
-    now = datetime.now(timezone.utc)
-    valid = [r for r in all_rems if r.at > now]
+    engine.start()
+    if not registry.loaded:
+        await registry.load_streaming()
 
-    # Если были просроченные — сохраняем
-    if len(valid) < len(all_rems):
-        application.bot_data["reminders"] = valid
-        await save_reminders(valid)
-    else:
-        application.bot_data["reminders"] = valid
 
-    for rem in valid:
-        schedule_reminder(rem, job_queue)
+async def _sync_leases(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Режим нескольких воркеров: продлевает аренды и перечитывает реестр,
+    чтобы тикер видел напоминания своих партиций (и добавленные другими
+    воркерами). Пропущенные (например, упал прежний владелец партиции)
+    уходят в очередь догона, как при запуске.
+    """
+    application: Application = context.application
+    leases: LeaseManager = application.bot_data["reminder_leases"]
+
+    try:
+        owned = await asyncio.to_thread(leases.refresh)
+    except Exception:
+        logger.exception("Не удалось продлить аренды напоминаний")
+        return
+
+    # Реестр перечитывается (напоминания могли добавить другие воркеры),
+    # но только свои партиции — выборка по ним, а не по всем напоминаниям
+    registry = get_registry(application, load=False)
+    await registry.recover_acks()
+    registry.reload(owned, leases.partitions)
+    engine = get_engine(application)
+    engine.resync()
+    engine.start()
+
+
+async def shutdown(application: Application) -> None:
+    """
+    Штатная остановка планировщика (до application.shutdown(), пока бот
+    может отправлять): останавливает тикер, отправляет открытые сводки,
+    дожидается начатых отправок (не дольше REMINDER_SHUTDOWN_TIMEOUT),
+    останавливает конвейер доставки, применяет подтверждения отправки
+    (flush_acks), затем отдаёт аренды воркера,
+    чтобы его партиции сразу подхватили другие, а не ждали REMINDER_LEASE_TTL.
+    """
+    engine: Optional[HorizonScheduler] = application.bot_data.get("reminder_engine")
+    stopping: Optional[asyncio.Task] = None
+    if engine is not None:
+        # Тикер останавливается сразу, начатые отправки дожидаемся ниже
+        stopping = asyncio.create_task(engine.stop())
+        await asyncio.sleep(0)
+    digest: Optional[DigestCoalescer] = application.bot_data.get("reminder_digest")
+    if digest is not None:
+        # Открытые сводки уходят сейчас, иначе отправки ждали бы окна
+        await digest.stop()
+    if stopping is not None:
+        try:
+            await asyncio.wait_for(asyncio.shield(stopping), REMINDER_SHUTDOWN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("Отправки напоминаний не завершились за %s с", REMINDER_SHUTDOWN_TIMEOUT)
+    pipeline: Optional[DeliveryPipeline] = application.bot_data.get("delivery_pipeline")
+    if pipeline is not None:
+        # Оставшееся в очереди и на повторе получает FAILED и остаётся в хранилище
+        await pipeline.stop()
+    if stopping is not None:
+        await stopping
+    registry = application.bot_data.get("reminder_registry")
+    if registry is not None:
+        # Подтверждённые отправки удаляем из хранилища сейчас, а не при следующем запуске
+        await registry.flush_acks()
+
+    leases: Optional[LeaseManager] = application.bot_data.get("reminder_leases")
+    if leases is not None:
+        await asyncio.to_thread(leases.release)
+        logger.info("Аренды воркера %s отданы", leases.worker_id)
 
 
 def setup(application: Application) -> None:
     """
     Регистрация планировщика напоминаний при старте.
     """
+    if REMINDER_LEASES:
+        # Несколько воркеров: каждый обслуживает только свои партиции
+        leases = LeaseManager(LEASE_DB_FILE, partitions=LEASE_PARTITIONS, ttl=LEASE_TTL)
+        application.bot_data["reminder_leases"] = leases
+        application.job_queue.run_repeating(_sync_leases, interval=LEASE_TTL / 3, first=0)
+        logger.info("Планировщик напоминаний в режиме аренд, воркер %s", leases.worker_id)
+        return
     # Запускаем _startup сразу после старта
     application.job_queue.run_once(_startup, when=0)
     logger.info("Инициализирован планировщик напоминаний при старте бота")
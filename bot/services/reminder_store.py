@@ -1,12 +1,27 @@
 import asyncio
+import fcntl
+import heapq
+import itertools
 import json
-from dataclasses import dataclass
-from datetime import datetime
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import uuid
+from array import array
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import List
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 
 import aiofiles
 
+from services.snapshot import ReminderSnapshot, SnapshotError, write_reminders
+
+# Логгер модуля
+logger = logging.getLogger(__name__)
+
 # Асинхронный лок для безопасности при записи
 _lock = asyncio.Lock()
 
@@ -14,14 +29,151 @@ _lock = asyncio.Lock()
 DATA_DIR = Path(__file__).parent.parent / "data"
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 REMINDERS_FILE = DATA_DIR / "reminders.json"
+# Файл межпроцессной блокировки (несколько воркеров uvicorn)
+LOCK_FILE = DATA_DIR / "reminders.json.lock"
+# База SQLite для бэкенда "sqlite"
+REMINDERS_DB = DATA_DIR / "reminders.db"
+# Журнал изменений для бэкенда "journal" (снимок — REMINDERS_FILE)
+REMINDERS_JOURNAL = DATA_DIR / "reminders.journal.jsonl"
+# Бинарный снимок для бэкенда "snapshot"
+REMINDERS_SNAPSHOT = DATA_DIR / "reminders.snap"
+# Журналы подтверждённых отправок (по файлу на процесс: reminders.acks.<pid>)
+REMINDERS_ACKS = DATA_DIR / "reminders.acks"
+
+# Бэкенд хранения: json (по умолчанию), sqlite, journal или snapshot
+REMINDER_BACKEND = os.getenv("REMINDER_BACKEND", "json").lower()
+# Пороги сжатия журнала: размер в байтах или отношение числа записей журнала к живым
+JOURNAL_MAX_BYTES = int(os.getenv("REMINDER_JOURNAL_MAX_BYTES", str(1024 * 1024)))
+JOURNAL_MAX_RATIO = float(os.getenv("REMINDER_JOURNAL_MAX_RATIO", "2.0"))
+JOURNAL_MIN_OPS = int(os.getenv("REMINDER_JOURNAL_MIN_OPS", "1000"))
+# Размер порции при потоковой загрузке на старте
+LOAD_CHUNK_SIZE = int(os.getenv("REMINDER_LOAD_CHUNK", "5000"))
+# Подтверждения отправки применяются к хранилищу пачкой: раз в интервал или по размеру
+ACK_BATCH_SIZE = int(os.getenv("REMINDER_ACK_BATCH", "200"))
+ACK_FLUSH_INTERVAL = float(os.getenv("REMINDER_ACK_INTERVAL", "1.0"))
+# Сколько id в одном DELETE ... IN (...): старые сборки SQLite принимают
+# не больше 999 параметров в запросе
+SQLITE_DELETE_CHUNK = 500
+
+def _epoch(at: datetime) -> float:
+    """Время в секундах epoch; наивное время считается UTC."""
+    if at.tzinfo is None:
+        at = at.replace(tzinfo=timezone.utc)
+    return at.timestamp()
+
+
+ReminderKey = Union[bytes, str]
+
+
+def reminder_key(rid: str) -> ReminderKey:
+    """
+    Ключ напоминания: 16 байт UUID для id в каноническом виде,
+    сама строка — для прочих (старых) id.
+    """
+    # Быстрый путь вместо uuid.UUID: форма xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx в нижнем регистре
+    if not isinstance(rid, str) or len(rid) != 36 or rid[8] != "-" or rid[13] != "-" or rid[18] != "-" or rid[23] != "-":
+        return rid
+    hexed = rid.replace("-", "")
+    if len(hexed) != 32 or hexed != hexed.lower():
+        return rid
+    try:
+        key = bytes.fromhex(hexed)
+    except ValueError:
+        return rid
+    return key if len(key) == 16 else rid
+
 
-@dataclass
 class Reminder:
-    """Структура напоминания."""
-    id: str
-    uid: int
-    at: datetime
-    msg: str
+    """
+    Структура напоминания в компактном виде: __slots__, время —
+    целые секунды epoch (UTC), id — 16 байт UUID. Свойства id и at
+    дают привычные строку и datetime. rule — правило повторения
+    (services.recurrence) для серий, None для разовых напоминаний.
+    """
+    __slots__ = ("key", "uid", "ts", "msg", "rule")
+
+    def __init__(self, id: str, uid: int, at: datetime, msg: str, rule: Optional[str] = None) -> None:
+        self.key: ReminderKey = reminder_key(id)
+        self.uid = uid
+        self.ts = int(_epoch(at))
+        self.msg = msg
+        self.rule = rule
+
+    @classmethod
+    def from_ts(cls, key: ReminderKey, uid: int, ts: int, msg: str, rule: Optional[str] = None) -> "Reminder":
+        """Создание без разбора строк (из базы, снимка, колонок)."""
+        r = cls.__new__(cls)
+        r.key = key
+        r.uid = uid
+        r.ts = ts
+        r.msg = msg
+        r.rule = rule
+        return r
+
+    @property
+    def id(self) -> str:
+        key = self.key
+        return str(uuid.UUID(bytes=key)) if isinstance(key, bytes) else key
+
+    @property
+    def at(self) -> datetime:
+        return datetime.fromtimestamp(self.ts, timezone.utc)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Reminder):
+            return NotImplemented
+        return (self.key, self.uid, self.ts, self.msg, self.rule) == (other.key, other.uid, other.ts, other.msg, other.rule)
+
+    def __repr__(self) -> str:
+        rule = f", rule={self.rule!r}" if self.rule else ""
+        return f"Reminder(id={self.id!r}, uid={self.uid!r}, at={self.at.isoformat()!r}, msg={self.msg!r}{rule})"
+
+
+class ReminderColumns:
+    """
+    Колоночное хранение для массовых проходов: uid и время — в array('q'),
+    id — подряд по 16 байт в bytearray. Поддерживает только UUID-id.
+    """
+
+    def __init__(self) -> None:
+        self.uids = array("q")
+        self.ts = array("q")
+        self.ids = bytearray()
+        self.msgs: List[str] = []
+        self.rules: List[Optional[str]] = []
+
+    @classmethod
+    def from_reminders(cls, reminders: Iterable[Reminder]) -> "ReminderColumns":
+        cols = cls()
+        for r in reminders:
+            cols.append(r)
+        return cols
+
+    def append(self, r: Reminder) -> None:
+        if not isinstance(r.key, bytes):
+            raise ValueError(f"Колоночное хранение требует UUID-id: {r.key!r}")
+        self.uids.append(r.uid)
+        self.ts.append(r.ts)
+        self.ids += r.key
+        self.msgs.append(r.msg)
+        self.rules.append(r.rule)
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    def __getitem__(self, i: int) -> Reminder:
+        return Reminder.from_ts(bytes(self.ids[16 * i:16 * i + 16]), self.uids[i], self.ts[i], self.msgs[i], self.rules[i])
+
+    def __iter__(self) -> Iterator[Reminder]:
+        return (self[i] for i in range(len(self)))
+
+    def due_before(self, ts: int) -> List[int]:
+        """Индексы напоминаний со временем раньше ts."""
+        return [i for i, t in enumerate(self.ts) if t < ts]
+
+    def for_user(self, uid: int) -> List[int]:
+        """Индексы напоминаний пользователя."""
+        return [i for i, u in enumerate(self.uids) if u == uid]
 
 
 def _parse_reminder(obj: dict) -> Reminder:
@@ -30,48 +182,1005 @@ def _parse_reminder(obj: dict) -> Reminder:
         id=obj["id"],
         uid=obj["uid"],
         at=datetime.fromisoformat(obj["at"]),
-        msg=obj["msg"]
+        msg=obj["msg"],
+        rule=obj.get("rule"),
     )
 
 
-def load_reminders() -> List[Reminder]:
+def _to_dict(r: Reminder) -> Dict[str, Any]:
+    """Преобразует Reminder в словарь для JSON."""
+    data = {"id": r.id, "uid": r.uid, "at": r.at.isoformat(), "msg": r.msg}
+    if r.rule:
+        data["rule"] = r.rule
+    return data
+
+
+def _chunked(items: List[Any], size: int) -> Iterator[List[Any]]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _parse_all(data: Iterable[dict]) -> List[Reminder]:
+    """Разбирает записи, пропуская повреждённые."""
+    result: List[Reminder] = []
+    for item in data:
+        try:
+            result.append(_parse_reminder(item))
+        except (KeyError, TypeError, ValueError):
+            logger.warning("Пропущена некорректная запись напоминания: %s", item)
+    return result
+
+
+class JsonBackend:
     """
-    Загружает список напоминаний из JSON-файла.
-    Если файл отсутствует или некорректен, возвращает пустой список.
+    Хранение в одном JSON-файле. Каждое изменение перечитывает и
+    переписывает файл под межпроцессной блокировкой. Чтения кешируются
+    до изменения файла (по mtime).
     """
-    if not REMINDERS_FILE.exists():
-        return []
-    try:
-        raw = REMINDERS_FILE.read_text(encoding="utf-8")
-        data = json.loads(raw)
-        return [_parse_reminder(item) for item in data]
-    except (json.JSONDecodeError, IOError):
-        return []
 
+    def __init__(self, path: Path = REMINDERS_FILE, lock_path: Path = LOCK_FILE) -> None:
+        self.path = path
+        self.lock_path = lock_path
+        self._cache: Optional[List[Reminder]] = None
+        self._mtime: Optional[int] = None
 
-async def save_reminders(reminders: List[Reminder]) -> bool:
+    @asynccontextmanager
+    async def _locked(self):
+        """
+        Блокировка файла напоминаний внутри процесса и между процессами,
+        чтобы воркеры не затирали записи друг друга.
+        """
+        async with _lock:
+            fd = os.open(self.lock_path, os.O_CREAT | os.O_RDWR, 0o644)
+            try:
+                await asyncio.to_thread(fcntl.flock, fd, fcntl.LOCK_EX)
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+
+    def _read_raw(self) -> List[Dict[str, Any]]:
+        """Читает записи как есть, без разбора (неизвестные поля сохраняются)."""
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            return data if isinstance(data, list) else []
+        except (json.JSONDecodeError, IOError):
+            return []
+
+    async def _write_raw(self, data: List[Dict[str, Any]]) -> None:
+        """
+        Пишет записи во временный файл и атомарно подменяет им основной:
+        читатели из других процессов не увидят полузаписанный файл.
+        """
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        async with aiofiles.open(tmp, "w", encoding="utf-8") as f:
+            await f.write(json.dumps(data, ensure_ascii=False, indent=2))
+        os.replace(tmp, self.path)
+        self._cache = None
+
+    def load_all(self) -> List[Reminder]:
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except OSError:
+            return []
+        if self._cache is None or mtime != self._mtime:
+            self._cache = _parse_all(self._read_raw())
+            self._mtime = mtime
+        return list(self._cache)
+
+    def load_chunks(self, size: int = LOAD_CHUNK_SIZE) -> Iterator[List[Reminder]]:
+        """Порции напоминаний: файл читается целиком, разбор — по порциям."""
+        for chunk in _chunked(self._read_raw(), size):
+            yield _parse_all(chunk)
+
+    def for_user(self, uid: int) -> List[Reminder]:
+        return [r for r in self.load_all() if r.uid == uid]
+
+    def due_before(self, t: datetime) -> List[Reminder]:
+        ts = _epoch(t)
+        return sorted((r for r in self.load_all() if r.ts < ts), key=lambda r: r.ts)
+
+    async def save_all(self, reminders: List[Reminder]) -> bool:
+        async with self._locked():
+            try:
+                await self._write_raw([_to_dict(r) for r in reminders])
+                return True
+            except Exception:
+                return False
+
+    async def add(self, reminder: Reminder) -> bool:
+        async with self._locked():
+            try:
+                # Тот же id заменяется (перенос серии на следующее срабатывание)
+                rid = reminder.id
+                data = [item for item in self._read_raw() if item.get("id") != rid]
+                data.append(_to_dict(reminder))
+                await self._write_raw(data)
+                return True
+            except Exception:
+                return False
+
+    async def delete(self, ids: Iterable[str], uid: Optional[int] = None) -> int:
+        drop = set(ids)
+        async with self._locked():
+            data = self._read_raw()
+            kept = [
+                item for item in data
+                if not (item.get("id") in drop and (uid is None or item.get("uid") == uid))
+            ]
+            removed = len(data) - len(kept)
+            if removed:
+                await self._write_raw(kept)
+            return removed
+
+
+class SnapshotBackend(JsonBackend):
     """
-    Сохраняет список напоминаний в JSON-файл асинхронно.
-    Возвращает True при успешной записи.
+    Хранение в бинарном снимке (services.snapshot): время уже в epoch,
+    файл отображается в память, выборки по uid и времени разбирают
+    только подходящие записи. Изменения, как у JsonBackend, переписывают
+    файл целиком под межпроцессной блокировкой.
     """
-    async with _lock:
+
+    def __init__(
+        self,
+        path: Path = REMINDERS_SNAPSHOT,
+        lock_path: Path = LOCK_FILE,
+        json_path: Optional[Path] = REMINDERS_FILE,
+    ) -> None:
+        super().__init__(path, lock_path)
+        self._snap: Optional[ReminderSnapshot] = None
+        if json_path is not None and not path.exists():
+            self._migrate_json(json_path)
+
+    def _migrate_json(self, json_path: Path) -> None:
+        """
+        Разовая миграция из reminders.json: записи переносятся в снимок,
+        файл переименовывается в *.migrated, чтобы не импортировать повторно.
+        """
+        if not json_path.exists():
+            return
         try:
-            data = [
-                {"id": r.id, "uid": r.uid, "at": r.at.isoformat(), "msg": r.msg}
-                for r in reminders
-            ]
-            async with aiofiles.open(REMINDERS_FILE, "w", encoding="utf-8") as f:
-                await f.write(json.dumps(data, ensure_ascii=False, indent=2))
+            raw = json.loads(json_path.read_text(encoding="utf-8") or "[]")
+        except (json.JSONDecodeError, IOError):
+            logger.exception("Не удалось прочитать %s для миграции", json_path)
+            return
+        reminders = _parse_all(raw if isinstance(raw, list) else [])
+        self._write(reminders)
+        os.replace(json_path, json_path.with_name(json_path.name + ".migrated"))
+        logger.info("Перенесено %s напоминаний из %s в снимок", len(reminders), json_path)
+
+    def _snapshot(self) -> Optional[ReminderSnapshot]:
+        """Снимок, отображённый в память; переоткрывается после изменения файла."""
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except OSError:
+            return None
+        if self._snap is None or mtime != self._mtime:
+            try:
+                snap = ReminderSnapshot(self.path)
+            except (SnapshotError, OSError):
+                logger.exception("Не удалось открыть снимок %s", self.path)
+                return None
+            if self._snap is not None:
+                self._snap.close()
+            self._snap, self._mtime, self._cache = snap, mtime, None
+        return self._snap
+
+    def _select(self, **where) -> List[Reminder]:
+        snap = self._snapshot()
+        if snap is None:
+            return []
+        return [Reminder.from_ts(*rec) for rec in snap.select(**where)]
+
+    def _write(self, reminders: List[Reminder]) -> None:
+        write_reminders(self.path, ((r.key, r.uid, r.ts, r.msg, r.rule) for r in reminders))
+        self._cache = None
+
+    def load_all(self) -> List[Reminder]:
+        snap = self._snapshot()
+        if snap is None:
+            return []
+        if self._cache is None:
+            self._cache = [Reminder.from_ts(*rec) for rec in snap]
+        return list(self._cache)
+
+    def load_chunks(self, size: int = LOAD_CHUNK_SIZE) -> Iterator[List[Reminder]]:
+        """Порции напоминаний из своего отображения снимка (безопасно в потоке)."""
+        try:
+            snap = ReminderSnapshot(self.path)
+        except (SnapshotError, OSError):
+            return
+        with snap:
+            chunk: List[Reminder] = []
+            for rec in snap:
+                chunk.append(Reminder.from_ts(*rec))
+                if len(chunk) >= size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+
+    def for_user(self, uid: int) -> List[Reminder]:
+        return self._select(uid=uid)
+
+    def due_before(self, t: datetime) -> List[Reminder]:
+        return sorted(self._select(before=_epoch(t)), key=lambda r: r.ts)
+
+    async def save_all(self, reminders: List[Reminder]) -> bool:
+        async with self._locked():
+            try:
+                await asyncio.to_thread(self._write, list(reminders))
+                return True
+            except Exception:
+                return False
+
+    async def add(self, reminder: Reminder) -> bool:
+        async with self._locked():
+            try:
+                reminders = [r for r in self.load_all() if r.key != reminder.key]
+                reminders.append(reminder)
+                await asyncio.to_thread(self._write, reminders)
+                return True
+            except Exception:
+                return False
+
+    async def delete(self, ids: Iterable[str], uid: Optional[int] = None) -> int:
+        drop = {reminder_key(i) for i in ids}
+        async with self._locked():
+            reminders = self.load_all()
+            kept = [r for r in reminders if not (r.key in drop and (uid is None or r.uid == uid))]
+            removed = len(reminders) - len(kept)
+            if removed:
+                await asyncio.to_thread(self._write, kept)
+            return removed
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS reminders (
+    id TEXT PRIMARY KEY,
+    uid INTEGER NOT NULL,
+    at REAL NOT NULL,
+    msg TEXT NOT NULL,
+    rule TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_reminders_uid ON reminders(uid);
+CREATE INDEX IF NOT EXISTS ix_reminders_at ON reminders(at);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+# Флаг в meta: reminders.json уже перенесён в базу
+_JSON_MIGRATED = "json_migrated"
+
+
+class SqliteBackend:
+    """
+    Хранение в SQLite (WAL) с индексами по uid и времени:
+    добавление и удаление — одна строка, выборки — по индексу.
+    Безопасно для нескольких процессов. Время хранится в epoch (UTC).
+    """
+
+    def __init__(self, db_path: Path = REMINDERS_DB, json_path: Optional[Path] = REMINDERS_FILE) -> None:
+        self.db_path = db_path
+        self._mutex = threading.Lock()
+        self._conn = sqlite3.connect(
+            str(db_path), timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        # Базы до появления повторяющихся напоминаний: добавляем колонку rule
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(reminders)")}
+        if "rule" not in columns:
+            self._conn.execute("ALTER TABLE reminders ADD COLUMN rule TEXT")
+        if json_path is not None:
+            self._migrate_json(json_path)
+
+    def _migrate_json(self, json_path: Path) -> None:
+        """
+        Разовая миграция из reminders.json: записи переносятся в базу,
+        файл переименовывается в *.migrated, чтобы не импортировать повторно.
+
+        Воркеров несколько, поэтому проверка и перенос идут в одной
+        транзакции BEGIN IMMEDIATE с флагом в таблице meta: первый переносит,
+        остальные видят флаг. Пропавший файл значит, что перенос уже был.
+        """
+        if not json_path.exists():
+            return
+        with self._mutex:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                done = self._conn.execute("SELECT 1 FROM meta WHERE key = ?", (_JSON_MIGRATED,)).fetchone()
+                reminders: List[Reminder] = []
+                if not done:
+                    try:
+                        raw = json.loads(json_path.read_text(encoding="utf-8") or "[]")
+                    except FileNotFoundError:
+                        raw = []
+                    except (json.JSONDecodeError, IOError):
+                        logger.exception("Не удалось прочитать %s для миграции", json_path)
+                        self._conn.execute("ROLLBACK")
+                        return
+                    reminders = _parse_all(raw if isinstance(raw, list) else [])
+                    self._conn.executemany(
+                        "INSERT OR IGNORE INTO reminders(id, uid, at, msg, rule) VALUES (?, ?, ?, ?, ?)",
+                        [(r.id, r.uid, r.ts, r.msg, r.rule) for r in reminders],
+                    )
+                    self._conn.execute("INSERT INTO meta(key, value) VALUES (?, '1')", (_JSON_MIGRATED,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        # Переименование и после сбоя между COMMIT и os.replace (флаг уже стоит)
+        try:
+            os.replace(json_path, json_path.with_name(json_path.name + ".migrated"))
+        except FileNotFoundError:
+            return
+        if not done:
+            logger.info("Перенесено %s напоминаний из %s в SQLite", len(reminders), json_path)
+
+    def _select(self, where: str = "", params: tuple = ()) -> List[Reminder]:
+        with self._mutex:
+            rows = self._conn.execute(
+                f"SELECT id, uid, at, msg, rule FROM reminders {where}", params
+            ).fetchall()
+        return [Reminder.from_ts(reminder_key(rid), uid, int(at), msg, rule) for rid, uid, at, msg, rule in rows]
+
+    def load_all(self) -> List[Reminder]:
+        return self._select("ORDER BY at")
+
+    def load_chunks(self, size: int = LOAD_CHUNK_SIZE) -> Iterator[List[Reminder]]:
+        """Порции по времени (ближайшие — первыми), постранично по (at, id)."""
+        where, params = "", ()
+        while True:
+            with self._mutex:
+                rows = self._conn.execute(
+                    f"SELECT id, uid, at, msg, rule FROM reminders {where} ORDER BY at, id LIMIT ?", params + (size,)
+                ).fetchall()
+            if not rows:
+                return
+            yield [Reminder.from_ts(reminder_key(rid), uid, int(at), msg, rule) for rid, uid, at, msg, rule in rows]
+            # Продолжаем строго после последней строки (по исходному at, без округления)
+            where, params = "WHERE (at, id) > (?, ?)", (rows[-1][2], rows[-1][0])
+
+    def for_user(self, uid: int) -> List[Reminder]:
+        return self._select("WHERE uid = ? ORDER BY at", (uid,))
+
+    def load_partitions(self, partitions: Iterable[int], count: int) -> List[Reminder]:
+        """Напоминания партиций uid % count (как у LeaseManager) одной выборкой."""
+        parts = sorted(partitions)
+        if not parts:
+            return []
+        marks = ", ".join("?" * len(parts))
+        # % в SQLite сохраняет знак делимого (у групп uid отрицательный) — приводим к Python
+        return self._select(f"WHERE ((uid % ?) + ?) % ? IN ({marks}) ORDER BY at", (count, count, count, *parts))
+
+    def due_before(self, t: datetime) -> List[Reminder]:
+        return self._select("WHERE at < ? ORDER BY at", (_epoch(t),))
+
+    def _execute(self, sql: str, params) -> int:
+        with self._mutex:
+            cur = self._conn.execute(sql, params)
+            return cur.rowcount
+
+    def _replace_all(self, rows: List[tuple]) -> None:
+        with self._mutex:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM reminders")
+                self._conn.executemany("INSERT INTO reminders(id, uid, at, msg, rule) VALUES (?, ?, ?, ?, ?)", rows)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    async def save_all(self, reminders: List[Reminder]) -> bool:
+        try:
+            await asyncio.to_thread(
+                self._replace_all, [(r.id, r.uid, r.ts, r.msg, r.rule) for r in reminders]
+            )
             return True
-        except Exception:
+        except sqlite3.Error:
+            logger.exception("Ошибка записи напоминаний в SQLite")
             return False
 
+    async def add(self, reminder: Reminder) -> bool:
+        try:
+            await asyncio.to_thread(
+                self._execute,
+                "INSERT OR REPLACE INTO reminders(id, uid, at, msg, rule) VALUES (?, ?, ?, ?, ?)",
+                (reminder.id, reminder.uid, reminder.ts, reminder.msg, reminder.rule),
+            )
+            return True
+        except sqlite3.Error:
+            logger.exception("Ошибка добавления напоминания %s в SQLite", reminder.id)
+            return False
+
+    def _delete_many(self, ids: List[str], uid: Optional[int]) -> int:
+        """Удаление пачками по SQLITE_DELETE_CHUNK id в одной транзакции."""
+        removed = 0
+        with self._mutex:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for chunk in _chunked(ids, SQLITE_DELETE_CHUNK):
+                    marks = ", ".join("?" * len(chunk))
+                    if uid is None:
+                        cur = self._conn.execute(f"DELETE FROM reminders WHERE id IN ({marks})", chunk)
+                    else:
+                        cur = self._conn.execute(
+                            f"DELETE FROM reminders WHERE id IN ({marks}) AND uid = ?", [*chunk, uid]
+                        )
+                    removed += cur.rowcount
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return removed
+
+    async def delete(self, ids: Iterable[str], uid: Optional[int] = None) -> int:
+        ids = list(ids)
+        if not ids:
+            return 0
+        return await asyncio.to_thread(self._delete_many, ids, uid)
+
+
+class JournalBackend:
+    """
+    Снимок (reminders.json) плюс журнал изменений в формате JSON Lines:
+    каждое добавление или удаление — одна дописанная строка, поэтому
+    запись стоит O(1) байт независимо от размера хранилища. При старте
+    снимок загружается и журнал проигрывается поверх него; оборванная
+    последняя строка (падение посреди записи) пропускается.
+
+    Когда журнал перерастает порог, фоновая задача пишет свежий снимок
+    и отбрасывает журнал. Состояние держится в памяти процесса, поэтому
+    бэкенд рассчитан на один процесс (для нескольких воркеров — sqlite).
+    """
+
+    def __init__(
+        self,
+        snapshot_path: Path = REMINDERS_FILE,
+        journal_path: Path = REMINDERS_JOURNAL,
+        max_bytes: int = JOURNAL_MAX_BYTES,
+        max_ratio: float = JOURNAL_MAX_RATIO,
+        min_ops: int = JOURNAL_MIN_OPS,
+    ) -> None:
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        # Журнал, отложенный на время сжатия
+        self.rotated_path = journal_path.with_name(journal_path.name + ".old")
+        self.max_bytes = max_bytes
+        self.max_ratio = max_ratio
+        self.min_ops = min_ops
+        self._state: Dict[ReminderKey, Reminder] = {}
+        self._ops = 0
+        self._compaction: Optional[asyncio.Task] = None
+        self._replay()
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+
+    def _replay(self) -> None:
+        """Загружает снимок и проигрывает журналы поверх него."""
+        try:
+            raw = json.loads(self.snapshot_path.read_text(encoding="utf-8") or "[]")
+        except (json.JSONDecodeError, IOError):
+            raw = []
+        for r in _parse_all(raw if isinstance(raw, list) else []):
+            self._state[r.key] = r
+        # Повторное применение операций идемпотентно, поэтому
+        # незавершённое сжатие (остался .old) проигрывается безопасно
+        for path in (self.rotated_path, self.journal_path):
+            if not path.exists():
+                continue
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self._apply(json.loads(line))
+                    except (json.JSONDecodeError, KeyError, TypeError, ValueError):
+                        logger.warning("Пропущена повреждённая строка журнала %s", path)
+                    self._ops += 1
+
+    def _apply(self, op: Dict[str, Any]) -> None:
+        if op["op"] == "add":
+            r = _parse_reminder(op["r"])
+            self._state[r.key] = r
+        elif op["op"] == "del":
+            for rid in op["ids"]:
+                self._state.pop(reminder_key(rid), None)
+
+    def _append(self, op: Dict[str, Any]) -> None:
+        """Дописывает одну операцию в журнал и применяет её."""
+        self._journal.write(json.dumps(op, ensure_ascii=False) + "\n")
+        self._journal.flush()
+        self._apply(op)
+        self._ops += 1
+        self._maybe_compact()
+
+    def _maybe_compact(self) -> None:
+        if self._compaction is not None and not self._compaction.done():
+            return
+        too_big = self._journal.tell() > self.max_bytes
+        too_long = self._ops >= self.min_ops and self._ops > self.max_ratio * max(len(self._state), 1)
+        if too_big or too_long:
+            self._compaction = asyncio.create_task(self.compact())
+
+    async def compact(self) -> None:
+        """
+        Пишет свежий снимок и отбрасывает журнал. Новые записи во время
+        сжатия идут в новый журнал, старый удаляется после снимка.
+        """
+        async with _lock:
+            self._journal.close()
+            if self.rotated_path.exists():
+                # .old от прерванного сжатия: его операции ещё не в снимке,
+                # поэтому не затираем его, а дописываем к нему текущий журнал
+                self._append_rotated()
+            else:
+                os.replace(self.journal_path, self.rotated_path)
+            self._journal = open(self.journal_path, "a", encoding="utf-8")
+            self._ops = 0
+            data = [_to_dict(r) for r in self._state.values()]
+
+        def write_snapshot() -> None:
+            tmp = self.snapshot_path.with_name(f"{self.snapshot_path.name}.{os.getpid()}.tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.snapshot_path)
+            self.rotated_path.unlink()
+
+        try:
+            await asyncio.to_thread(write_snapshot)
+            logger.info("Журнал напоминаний сжат: %s записей в снимке", len(data))
+        except OSError:
+            logger.exception("Ошибка сжатия журнала напоминаний")
+
+    def _append_rotated(self) -> None:
+        """
+        Дописывает журнал в конец .old и удаляет журнал. Упадём между
+        этими шагами — при старте оба проиграются, а повтор тех же
+        операций даёт то же состояние.
+        """
+        with open(self.rotated_path, "rb+") as old, open(self.journal_path, "rb") as cur:
+            if old.seek(0, os.SEEK_END):
+                old.seek(-1, os.SEEK_END)
+                if old.read(1) != b"\n":
+                    # Оборванная последняя строка не должна склеиться с первой новой
+                    old.write(b"\n")
+            shutil.copyfileobj(cur, old)
+            old.flush()
+            os.fsync(old.fileno())
+        os.remove(self.journal_path)
+
+    def load_all(self) -> List[Reminder]:
+        return list(self._state.values())
+
+    def load_chunks(self, size: int = LOAD_CHUNK_SIZE) -> Iterator[List[Reminder]]:
+        # Состояние уже в памяти: копия списка снимается сразу, порции — из неё
+        return _chunked(self.load_all(), size)
+
+    def for_user(self, uid: int) -> List[Reminder]:
+        return [r for r in self._state.values() if r.uid == uid]
+
+    def due_before(self, t: datetime) -> List[Reminder]:
+        ts = _epoch(t)
+        return sorted((r for r in self._state.values() if r.ts < ts), key=lambda r: r.ts)
+
+    async def save_all(self, reminders: List[Reminder]) -> bool:
+        try:
+            async with _lock:
+                self._append({"op": "del", "ids": [r.id for r in self._state.values()]})
+                for r in reminders:
+                    self._append({"op": "add", "r": _to_dict(r)})
+            return True
+        except OSError:
+            logger.exception("Ошибка записи журнала напоминаний")
+            return False
+
+    async def add(self, reminder: Reminder) -> bool:
+        try:
+            async with _lock:
+                self._append({"op": "add", "r": _to_dict(reminder)})
+            return True
+        except OSError:
+            logger.exception("Ошибка записи журнала напоминаний")
+            return False
+
+    async def delete(self, ids: Iterable[str], uid: Optional[int] = None) -> int:
+        found = (self._state.get(reminder_key(rid)) for rid in dict.fromkeys(ids))
+        drop = [r.id for r in found if r is not None and (uid is None or r.uid == uid)]
+        if drop:
+            async with _lock:
+                self._append({"op": "del", "ids": drop})
+        return len(drop)
+
+
+class ReminderRegistry:
+    """
+    Единый реестр напоминаний в памяти процесса поверх бэкенда хранения.
+    Индексы: ключ -> Reminder, uid -> {ключ -> Reminder} и min-куча по времени.
+    Поиск, добавление и удаление — O(1) или O(log n); изменения сразу
+    пишутся в бэкенд одной операцией.
+
+    Куча — очередь напоминаний, ещё не взятых планировщиком: pop_due()
+    выдаёт их по времени. Удалённые записи из кучи выбрасываются лениво.
+    Обработчики on_add / on_delete (например, планировщик) вызываются
+    после успешного изменения.
+
+    Отправленные напоминания подтверждаются через ack(): они сразу
+    пропадают из индексов, id дописывается в журнал подтверждений
+    процесса, а к хранилищу удаления применяются пачкой
+    (flush_acks). recover_acks() при запуске доприменяет журналы,
+    оставшиеся после падения, — отправленное не уйдёт повторно.
+    """
+
+    def __init__(
+        self,
+        backend,
+        ack_path: Optional[Path] = None,
+        ack_batch: int = ACK_BATCH_SIZE,
+        ack_interval: float = ACK_FLUSH_INTERVAL,
+    ) -> None:
+        self._backend = backend
+        # Журнал подтверждений этого процесса; без него ack() удаляет сразу
+        self._ack_path = ack_path.with_name(f"{ack_path.name}.{os.getpid()}") if ack_path is not None else None
+        self._ack_batch = ack_batch
+        self._ack_interval = ack_interval
+        # Подтверждённые, но ещё не удалённые из хранилища: ключ -> id
+        self._tombstones: Dict[ReminderKey, str] = {}
+        self._ack_flush: Optional[asyncio.Task] = None
+        self._ack_full = asyncio.Event()
+        # Загружен ли реестр; ключи, удалённые во время потоковой загрузки
+        self.loaded = False
+        self._deleted_while_loading: Optional[set] = None
+        self._by_key: Dict[ReminderKey, Reminder] = {}
+        self._by_user: Dict[int, Dict[ReminderKey, Reminder]] = {}
+        # (время, порядковый номер, ключ): номер разводит равные времена
+        self._heap: List[Tuple[int, int, ReminderKey]] = []
+        self._seq = itertools.count()
+        self.on_add: Optional[Callable[[Reminder], None]] = None
+        self.on_delete: Optional[Callable[[Reminder], None]] = None
+        # Партиции в индексах (frozenset партиций, их число); None — все
+        self._scope: Optional[Tuple[frozenset, int]] = None
+
+    def reload(self, partitions: Optional[Set[int]] = None, count: int = 0) -> None:
+        """
+        Перестраивает индексы по содержимому бэкенда. С partitions —
+        только напоминания партиций uid % count (режим аренд: воркер
+        держит в памяти лишь свои); остальные пользователи читаются из
+        бэкенда напрямую (for_user, delete).
+        """
+        if partitions is None:
+            self._scope = None
+            reminders = self._backend.load_all()
+        else:
+            self._scope = (frozenset(partitions), count)
+            load = getattr(self._backend, "load_partitions", None)
+            if load is not None:
+                reminders = load(partitions, count)
+            else:
+                reminders = [r for r in self._backend.load_all() if r.uid % count in partitions]
+        self._by_key = {}
+        self._by_user = {}
+        for r in reminders:
+            if r.key not in self._tombstones:
+                self._index(r)
+        self._rebuild_heap()
+        self.loaded = True
+
+    def _in_scope(self, uid: int) -> bool:
+        """Напоминания пользователя держатся в индексах этого процесса?"""
+        return self._scope is None or uid % self._scope[1] in self._scope[0]
+
+    async def load_streaming(self, chunk_size: int = LOAD_CHUNK_SIZE) -> int:
+        """
+        Загружает реестр из бэкенда порциями: чтение идёт в потоке, между
+        порциями цикл событий свободен, и уже загруженные напоминания
+        сразу доступны куче (планировщик может работать параллельно).
+        Возвращает число загруженных напоминаний.
+        """
+        self._by_key = {}
+        self._by_user = {}
+        self._heap = []
+        self._deleted_while_loading = set()
+        chunks = self._backend.load_chunks(chunk_size)
+        count = 0
+        try:
+            while True:
+                chunk = await asyncio.to_thread(next, chunks, None)
+                if chunk is None:
+                    break
+                for r in chunk:
+                    if r.key in self._tombstones or r.key in self._deleted_while_loading:
+                        continue
+                    if r.key in self._by_key:
+                        continue
+                    self._index(r)
+                    heapq.heappush(self._heap, (r.ts, next(self._seq), r.key))
+                    count += 1
+        finally:
+            self._deleted_while_loading = None
+            self.loaded = True
+        logger.info("Загружено %s напоминаний", count)
+        return count
+
+    def _rebuild_heap(self) -> None:
+        self._heap = [(r.ts, next(self._seq), r.key) for r in self._by_key.values()]
+        heapq.heapify(self._heap)
+
+    def _index(self, r: Reminder) -> None:
+        self._by_key[r.key] = r
+        self._by_user.setdefault(r.uid, {})[r.key] = r
+
+    def _unindex(self, r: Reminder) -> None:
+        self._by_key.pop(r.key, None)
+        user = self._by_user.get(r.uid)
+        if user is not None:
+            user.pop(r.key, None)
+            if not user:
+                del self._by_user[r.uid]
+
+    def __len__(self) -> int:
+        return len(self._by_key)
+
+    def get(self, rid: str) -> Optional[Reminder]:
+        return self._by_key.get(reminder_key(rid))
+
+    def live(self, reminder: Reminder) -> bool:
+        """
+        Напоминание всё ещё в реестре (не удалено и время не менялось)?
+        Сравнивается по ключу и времени: после reload() в индексах уже
+        другие объекты тех же записей.
+        """
+        return self._live(reminder.ts, reminder.key) is not None
+
+    def all(self) -> List[Reminder]:
+        return list(self._by_key.values())
+
+    def for_user(self, uid: int) -> List[Reminder]:
+        """Напоминания пользователя по времени."""
+        if not self._in_scope(uid):
+            # Чужая партиция: индексы её не держат, читаем из бэкенда
+            return [r for r in self._backend.for_user(uid) if r.key not in self._tombstones]
+        return sorted(self._by_user.get(uid, {}).values(), key=lambda r: r.ts)
+
+    async def add(self, reminder: Reminder) -> bool:
+        """Сохраняет напоминание в бэкенде и добавляет в индексы."""
+        if not await self._backend.add(reminder):
+            return False
+        old = self._by_key.get(reminder.key)
+        if old is not None:
+            self._unindex(old)
+        self._index(reminder)
+        heapq.heappush(self._heap, (reminder.ts, next(self._seq), reminder.key))
+        if self.on_add is not None:
+            self.on_add(reminder)
+        return True
+
+    async def delete(self, ids: Iterable[str], uid: Optional[int] = None) -> int:
+        """
+        Удаляет напоминания по id (только пользователя uid, если задан).
+        Возвращает число удалённых записей.
+        """
+        if uid is not None and not self._in_scope(uid):
+            # Чужая партиция: в индексах её нет, удаляем прямо в бэкенде
+            return await self._backend.delete(list(ids), uid)
+        found = [
+            r for r in (self._by_key.get(reminder_key(rid)) for rid in dict.fromkeys(ids))
+            if r is not None and (uid is None or r.uid == uid)
+        ]
+        if not found:
+            return 0
+        await self._backend.delete([r.id for r in found], uid)
+        for r in found:
+            self._unindex(r)
+            if self._deleted_while_loading is not None:
+                self._deleted_while_loading.add(r.key)
+            if self.on_delete is not None:
+                self.on_delete(r)
+        # Куча чистится лениво; перестраиваем, если мусора стало много
+        if len(self._heap) > 2 * len(self._by_key) + 1024:
+            self._rebuild_heap()
+        return len(found)
+
+    def ack(self, reminder: Reminder) -> None:
+        """
+        Подтверждает отправку: убирает напоминание из индексов и пишет
+        id в журнал подтверждений; из хранилища оно удалится пачкой.
+        """
+        if self._ack_path is None:
+            asyncio.create_task(self.delete([reminder.id]))
+            return
+        # Живая запись по ключу и времени (после reload() это другой объект);
+        # удалённое или перенесённое за время отправки не трогаем
+        live = self._live(reminder.ts, reminder.key)
+        if live is None:
+            return
+        reminder = live
+        self._unindex(reminder)
+        self._tombstones[reminder.key] = reminder.id
+        if self._deleted_while_loading is not None:
+            self._deleted_while_loading.add(reminder.key)
+        # Запись в ядро до возврата: после падения процесса id не потеряется
+        fd = os.open(self._ack_path, os.O_CREAT | os.O_WRONLY | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, (reminder.id + "\n").encode("utf-8"))
+        finally:
+            os.close(fd)
+        if self.on_delete is not None:
+            self.on_delete(reminder)
+        if len(self._tombstones) >= self._ack_batch:
+            self._ack_full.set()
+        if self._ack_flush is None or self._ack_flush.done():
+            self._ack_flush = asyncio.create_task(self._flush_acks_later())
+
+    async def _flush_acks_later(self) -> None:
+        """Ждёт интервал (или полную пачку) и применяет подтверждения."""
+        try:
+            await asyncio.wait_for(self._ack_full.wait(), timeout=self._ack_interval)
+        except asyncio.TimeoutError:
+            pass
+        self._ack_full.clear()
+        await self.flush_acks()
+
+    async def flush_acks(self) -> int:
+        """Удаляет подтверждённые напоминания из хранилища одной операцией."""
+        if not self._tombstones:
+            return 0
+        batch = dict(self._tombstones)
+        try:
+            await self._backend.delete(list(batch.values()))
+        except Exception:
+            logger.exception("Не удалось применить %s подтверждений", len(batch))
+            return 0
+        for key in batch:
+            self._tombstones.pop(key, None)
+        # В журнале остаются только подтверждения, пришедшие во время записи
+        rest = "".join(rid + "\n" for rid in self._tombstones.values())
+        tmp = self._ack_path.with_name(self._ack_path.name + ".tmp")
+        tmp.write_text(rest, encoding="utf-8")
+        os.replace(tmp, self._ack_path)
+        return len(batch)
+
+    async def recover_acks(self) -> int:
+        """
+        Доприменяет журналы подтверждений, оставшиеся от прошлых запусков
+        (и от упавших воркеров): эти напоминания уже отправлены.
+        """
+        if self._ack_path is None:
+            return 0
+        base = self._ack_path.name.rsplit(".", 1)[0]
+        recovered = 0
+        for path in self._ack_path.parent.glob(f"{base}.*"):
+            pid = path.name[len(base) + 1:]
+            if not pid.isdigit() or (int(pid) != os.getpid() and _pid_alive(int(pid))):
+                continue
+            ids = [line.strip() for line in path.read_text(encoding="utf-8").splitlines() if line.strip()]
+            if ids:
+                await self._backend.delete(ids)
+                for rid in ids:
+                    r = self._by_key.get(reminder_key(rid))
+                    if r is not None:
+                        self._unindex(r)
+                recovered += len(ids)
+            if path != self._ack_path:
+                path.unlink()
+        if recovered:
+            logger.info("Доприменено %s подтверждений отправки", recovered)
+        return recovered
+
+    def _live(self, ts: int, key: ReminderKey) -> Optional[Reminder]:
+        """Запись кучи ещё актуальна (не удалена и время не менялось)?"""
+        r = self._by_key.get(key)
+        return r if r is not None and r.ts == ts else None
+
+    def next_due(self) -> Optional[Reminder]:
+        """Ближайшее по времени напоминание из кучи (без извлечения)."""
+        while self._heap:
+            ts, _, key = self._heap[0]
+            r = self._live(ts, key)
+            if r is not None:
+                return r
+            heapq.heappop(self._heap)
+        return None
+
+    def pop_due(self, t: datetime) -> List[Reminder]:
+        """Извлекает из кучи напоминания со временем раньше t (по возрастанию)."""
+        limit = _epoch(t)
+        result: List[Reminder] = []
+        while self._heap and self._heap[0][0] < limit:
+            ts, _, key = heapq.heappop(self._heap)
+            r = self._live(ts, key)
+            if r is not None:
+                result.append(r)
+        return result
+
+
+def _pid_alive(pid: int) -> bool:
+    """Процесс с таким pid ещё работает?"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+_backend = None
+
+
+def get_backend():
+    """Бэкенд хранения, выбранный REMINDER_BACKEND (создаётся один раз)."""
+    global _backend
+    if _backend is None:
+        if REMINDER_BACKEND == "sqlite":
+            _backend = SqliteBackend()
+        elif REMINDER_BACKEND == "journal":
+            _backend = JournalBackend()
+        elif REMINDER_BACKEND == "snapshot":
+            _backend = SnapshotBackend()
+        elif REMINDER_BACKEND == "json":
+            _backend = JsonBackend()
+        else:
+            raise RuntimeError(f"Неизвестный REMINDER_BACKEND: {REMINDER_BACKEND}")
+    return _backend
+
+
+def load_reminders() -> List[Reminder]:
+    """
+    Загружает список напоминаний из хранилища.
+    Если данных нет или они некорректны, возвращает пустой список.
+    """
+    return get_backend().load_all()
+
+
+def reminders_for_user(uid: int) -> List[Reminder]:
+    """Напоминания одного пользователя."""
+    return get_backend().for_user(uid)
+
+
+def reminders_due_before(t: datetime) -> List[Reminder]:
+    """Напоминания со временем раньше t, по возрастанию времени."""
+    return get_backend().due_before(t)
+
+
+async def save_reminders(reminders: List[Reminder]) -> bool:
+    """
+    Полностью заменяет содержимое хранилища.
+    Возвращает True при успешной записи.
+    """
+    return await get_backend().save_all(reminders)
+
 
 async def add_reminder(reminder: Reminder) -> bool:
     """
     Добавляет новое напоминание в хранилище.
-    Загружает существующие, добавляет, сохраняет.
+    Добавления из других воркеров не теряются.
+    """
+    return await get_backend().add(reminder)
+
+
+async def delete_reminders(ids: Iterable[str], uid: Optional[int] = None) -> int:
+    """
+    Удаляет напоминания по id (только пользователя uid, если задан).
+    Возвращает число удалённых записей.
+    """
+    return await get_backend().delete(ids, uid)
+
+
+def get_registry(application, load: bool = True) -> ReminderRegistry:
+    """
+    Общий реестр напоминаний приложения (bot_data["reminder_registry"]),
+    загружается из бэкенда при первом обращении. С load=False создаётся
+    пустым — для потоковой загрузки (load_streaming).
     """
-    reminders = load_reminders()
-    reminders.append(reminder)
-    return await save_reminders(reminders)
+    registry = application.bot_data.get("reminder_registry")
+    if registry is None:
+        registry = ReminderRegistry(get_backend(), ack_path=REMINDERS_ACKS)
+        if load:
+            registry.reload()
+        application.bot_data["reminder_registry"] = registry
+    return registry
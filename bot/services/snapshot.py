@@ -0,0 +1,298 @@
+"""
+Бинарные снимки напоминаний и профилей для быстрой загрузки.
+
+Формат файла (little-endian):
+
+    заголовок: magic b"TGSN", версия u16, вид u16, число записей u32
+    запись:    длина тела u32, тело
+
+Тело напоминания: uid i64, ts i64 (секунды epoch, UTC), вид ключа u8
+(0 — 16 байт UUID, 1 — строка), длина ключа u16, длина правила u16,
+ключ, правило повторения (UTF-8, пусто — разовое), текст (UTF-8).
+В версии 1 правила нет (ни длины, ни поля); такие файлы читаются.
+Тело профиля: длина uid u16, uid (UTF-8), профиль (JSON).
+
+Файл отображается в память (mmap); записи разбираются только при
+обращении, выборки по uid и времени читают одни фиксированные поля.
+
+Конвертер (из каталога bot/):
+    python -m services.snapshot to-bin reminders data/reminders.json data/reminders.snap
+    python -m services.snapshot to-json profiles data/user_data.snap data/user_data.json
+"""
+import argparse
+import json
+import logging
+import mmap
+import os
+import struct
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+try:
+    import orjson
+except ImportError:  # orjson не обязателен — падаем на стандартный json
+    orjson = None
+
+# Логгер модуля
+logger = logging.getLogger(__name__)
+
+MAGIC = b"TGSN"
+VERSION = 2
+# Версии, которые умеем читать (пишем всегда VERSION)
+READABLE_VERSIONS = (1, 2)
+KIND_REMINDERS = 1
+KIND_PROFILES = 2
+
+_HEADER = struct.Struct("<4sHHI")
+_LENGTH = struct.Struct("<I")
+_REMINDER_V1 = struct.Struct("<qqBH")
+_REMINDER = struct.Struct("<qqBHH")
+# uid и ts — первые поля тела в обеих версиях
+_UID_TS = struct.Struct("<qq")
+_PROFILE = struct.Struct("<H")
+
+_KEY_UUID = 0
+_KEY_STR = 1
+
+# (ключ, uid, ts, текст, правило); ключ — 16 байт UUID или строка
+ReminderRecord = Tuple[Union[bytes, str], int, int, str, Optional[str]]
+
+
+class SnapshotError(ValueError):
+    """Файл не является снимком нужного вида или версии."""
+
+
+def _dumps(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _loads(data: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class _Snapshot:
+    """Снимок, отображённый в память; смещения записей строятся при первом обращении."""
+
+    kind = 0
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            # Пустой файл mmap не отображает (ValueError) — проверяем размер заранее
+            if os.fstat(f.fileno()).st_size < _HEADER.size:
+                raise SnapshotError(f"{self.path}: файл короче заголовка")
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, kind, count = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise SnapshotError(f"{self.path}: не снимок")
+        if version not in READABLE_VERSIONS:
+            raise SnapshotError(f"{self.path}: неподдерживаемая версия {version}")
+        if kind != self.kind:
+            raise SnapshotError(f"{self.path}: вид {kind}, ожидался {self.kind}")
+        self.version = version
+        self.count = count
+        self._offsets: Optional[List[int]] = None
+
+    def _index(self) -> List[int]:
+        """Смещения тел записей: проход только по длинам, без разбора."""
+        if self._offsets is None:
+            offsets = []
+            mm = self._mm
+            pos = _HEADER.size
+            end = len(mm)
+            for _ in range(self.count):
+                if pos + _LENGTH.size > end:
+                    raise SnapshotError(f"{self.path}: файл обрезан")
+                (length,) = _LENGTH.unpack_from(mm, pos)
+                pos += _LENGTH.size
+                offsets.append(pos)
+                pos += length
+            if pos > end:
+                raise SnapshotError(f"{self.path}: файл обрезан")
+            self._offsets = offsets
+        return self._offsets
+
+    def __len__(self) -> int:
+        return self.count
+
+    def close(self) -> None:
+        self._mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class ReminderSnapshot(_Snapshot):
+    """Снимок напоминаний: записи (ключ, uid, ts, текст, правило) по индексу."""
+
+    kind = KIND_REMINDERS
+
+    def _decode(self, pos: int) -> ReminderRecord:
+        mm = self._mm
+        if self.version == 1:
+            uid, ts, key_kind, key_len = _REMINDER_V1.unpack_from(mm, pos)
+            rule_len, start = 0, pos + _REMINDER_V1.size
+        else:
+            uid, ts, key_kind, key_len, rule_len = _REMINDER.unpack_from(mm, pos)
+            start = pos + _REMINDER.size
+        key = mm[start:start + key_len]
+        start += key_len
+        rule = mm[start:start + rule_len].decode("utf-8") or None
+        (length,) = _LENGTH.unpack_from(mm, pos - _LENGTH.size)
+        msg = mm[start + rule_len:pos + length].decode("utf-8")
+        return (key if key_kind == _KEY_UUID else key.decode("utf-8")), uid, ts, msg, rule
+
+    def __getitem__(self, i: int) -> ReminderRecord:
+        return self._decode(self._index()[i])
+
+    def __iter__(self) -> Iterator[ReminderRecord]:
+        for pos in self._index():
+            yield self._decode(pos)
+
+    def select(self, uid: Optional[int] = None, before: Optional[float] = None) -> Iterator[ReminderRecord]:
+        """
+        Записи пользователя uid и/или со временем раньше before.
+        Ключ и текст разбираются только у подходящих записей.
+        """
+        mm = self._mm
+        for pos in self._index():
+            r_uid, r_ts = _UID_TS.unpack_from(mm, pos)
+            if (uid is None or r_uid == uid) and (before is None or r_ts < before):
+                yield self._decode(pos)
+
+
+class ProfileSnapshot(_Snapshot, Mapping):
+    """
+    Снимок профилей как Mapping {str(uid): профиль}, только для чтения.
+    Профиль разбирается из JSON при первом обращении и кешируется.
+    """
+
+    kind = KIND_PROFILES
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        super().__init__(path)
+        self._by_uid: Optional[Dict[str, int]] = None
+        self._decoded: Dict[str, Dict[str, Any]] = {}
+
+    def _uids(self) -> Dict[str, int]:
+        if self._by_uid is None:
+            mm = self._mm
+            by_uid = {}
+            for pos in self._index():
+                (uid_len,) = _PROFILE.unpack_from(mm, pos)
+                start = pos + _PROFILE.size
+                by_uid[mm[start:start + uid_len].decode("utf-8")] = pos
+            self._by_uid = by_uid
+        return self._by_uid
+
+    def __getitem__(self, uid: str) -> Dict[str, Any]:
+        profile = self._decoded.get(uid)
+        if profile is None:
+            pos = self._uids()[uid]
+            (uid_len,) = _PROFILE.unpack_from(self._mm, pos)
+            (length,) = _LENGTH.unpack_from(self._mm, pos - _LENGTH.size)
+            profile = _loads(self._mm[pos + _PROFILE.size + uid_len:pos + length])
+            self._decoded[uid] = profile
+        return profile
+
+    def __contains__(self, uid: object) -> bool:
+        return uid in self._uids()
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._uids())
+
+
+def _write(path: Union[str, Path], kind: int, bodies: Iterable[bytes]) -> int:
+    """
+    Пишет снимок во временный файл рядом и атомарно подменяет им path.
+    Возвращает число записей.
+    """
+    path = str(path)
+    dir_name = os.path.dirname(path)
+    if dir_name:
+        os.makedirs(dir_name, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    count = 0
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, kind, 0))
+        for body in bodies:
+            f.write(_LENGTH.pack(len(body)))
+            f.write(body)
+            count += 1
+        f.seek(0)
+        f.write(_HEADER.pack(MAGIC, VERSION, kind, count))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return count
+
+
+def _reminder_body(record: ReminderRecord) -> bytes:
+    key, uid, ts, msg, rule = record
+    if isinstance(key, bytes):
+        key_kind, raw_key = _KEY_UUID, key
+    else:
+        key_kind, raw_key = _KEY_STR, key.encode("utf-8")
+    raw_rule = rule.encode("utf-8") if rule else b""
+    return _REMINDER.pack(uid, ts, key_kind, len(raw_key), len(raw_rule)) + raw_key + raw_rule + msg.encode("utf-8")
+
+
+def _profile_body(uid: str, profile: Dict[str, Any]) -> bytes:
+    raw_uid = str(uid).encode("utf-8")
+    return _PROFILE.pack(len(raw_uid)) + raw_uid + _dumps(profile)
+
+
+def write_reminders(path: Union[str, Path], records: Iterable[ReminderRecord]) -> int:
+    """Записывает снимок напоминаний из записей (ключ, uid, ts, текст, правило)."""
+    return _write(path, KIND_REMINDERS, (_reminder_body(r) for r in records))
+
+
+def write_profiles(path: Union[str, Path], profiles: Mapping) -> int:
+    """Записывает снимок профилей {str(uid): профиль}."""
+    return _write(path, KIND_PROFILES, (_profile_body(uid, p) for uid, p in list(profiles.items())))
+
+
+def _convert(kind: str, direction: str, src: Path, dst: Path) -> int:
+    """JSON <-> снимок для reminders или profiles. Возвращает число записей."""
+    if kind == "reminders":
+        from services.reminder_store import Reminder, _parse_all, _to_dict
+
+        if direction == "to-bin":
+            data = json.loads(src.read_text(encoding="utf-8") or "[]")
+            reminders = _parse_all(data if isinstance(data, list) else [])
+            return write_reminders(dst, ((r.key, r.uid, r.ts, r.msg, r.rule) for r in reminders))
+        with ReminderSnapshot(src) as snap:
+            data = [_to_dict(Reminder.from_ts(*rec)) for rec in snap]
+    else:
+        if direction == "to-bin":
+            data = json.loads(src.read_text(encoding="utf-8") or "{}")
+            return write_profiles(dst, data if isinstance(data, dict) else {})
+        with ProfileSnapshot(src) as snap:
+            data = {uid: snap[uid] for uid in snap}
+    from utils.json_utils import _write_atomic
+
+    _write_atomic(str(dst), data)
+    return len(data)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Конвертер JSON <-> бинарный снимок")
+    parser.add_argument("direction", choices=("to-bin", "to-json"))
+    parser.add_argument("kind", choices=("reminders", "profiles"))
+    parser.add_argument("src", type=Path)
+    parser.add_argument("dst", type=Path)
+    args = parser.parse_args()
+    count = _convert(args.kind, args.direction, args.src, args.dst)
+    print(f"{args.src} -> {args.dst}: {count} записей")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import os
+import time
+from typing import List, Optional
+
+from telegram import Message
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+# Логгер модуля
+logger = logging.getLogger(__name__)
+
+# Не чаще одной правки сообщения за столько секунд (лимит Telegram ~1 в секунду на чат)
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+# Правка только если с прошлой добавилось хотя бы столько символов
+STREAM_EDIT_MIN_CHARS = int(os.getenv("STREAM_EDIT_MIN_CHARS", "30"))
+
+# Лимит длины сообщения Telegram
+_MAX_LEN = 4096
+# Признак, что ответ ещё пишется
+_CURSOR = " ▌"
+
+
+class StreamingReply:
+    """
+    Ответ, который дописывается по мере генерации: сначала заглушка,
+    затем правки сообщения последним текстом.
+
+    append() только копит фрагменты; склейка и разбиение на сообщения —
+    лишь когда подошла правка. Правки делает фоновая задача не чаще
+    interval и не ради меньше min_chars новых символов. RetryAfter (429)
+    откладывает следующую правку. Текст длиннее лимита Telegram
+    продолжается в новых сообщениях. finish() дописывает окончательный
+    текст без курсора и удаляет лишние продолжения.
+    """
+
+    def __init__(
+        self,
+        reply_to: Message,
+        placeholder: str,
+        interval: float = STREAM_EDIT_INTERVAL,
+        min_chars: int = STREAM_EDIT_MIN_CHARS,
+    ) -> None:
+        self.reply_to = reply_to
+        self.placeholder = placeholder
+        self.interval = interval
+        self.min_chars = min_chars
+        # Пришедшие фрагменты; склеиваются в один при правке
+        self._parts: List[str] = []
+        self._size = 0
+        # Отправленные сообщения и показанный в каждом текст
+        self._messages: List[Message] = []
+        self._shown: List[str] = []
+        self._rendered = 0
+        self._next_edit = 0.0
+        # До этого момента Telegram просил не писать (RetryAfter)
+        self._retry_at = 0.0
+        self._dirty = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.edits = 0
+
+    async def start(self) -> None:
+        """Отправляет заглушку и запускает правки."""
+        message = await self.reply_to.reply_text(self.placeholder)
+        self._messages.append(message)
+        self._shown.append(self.placeholder)
+        self._next_edit = time.monotonic() + self.interval
+        self._task = asyncio.create_task(self._run())
+
+    @property
+    def started(self) -> bool:
+        """Заглушка уже отправлена."""
+        return bool(self._messages)
+
+    async def append(self, delta: str) -> None:
+        """Очередной фрагмент ответа."""
+        self._parts.append(delta)
+        self._size += len(delta)
+        if self._size - self._rendered >= self.min_chars:
+            self._dirty.set()
+
+    def _joined(self) -> str:
+        if len(self._parts) > 1:
+            self._parts[:] = ["".join(self._parts)]
+        return self._parts[0].lstrip() if self._parts else ""
+
+    async def finish(self, text: str) -> None:
+        """Останавливает правки и показывает окончательный текст."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._render(text, final=True)
+
+    async def _run(self) -> None:
+        while True:
+            await self._dirty.wait()
+            await self._wait_turn(final=False)
+            self._dirty.clear()
+            await self._render(self._joined() + _CURSOR, final=False)
+
+    async def _render(self, text: str, final: bool) -> None:
+        """Раскладывает text по сообщениям и правит изменившиеся."""
+        self._rendered = self._size
+        parts = [text[i:i + _MAX_LEN] for i in range(0, len(text), _MAX_LEN)] or [self.placeholder]
+        for i, part in enumerate(parts):
+            if i < len(self._messages):
+                if self._shown[i] != part:
+                    await self._edit(i, part, final)
+            else:
+                await self._send(part, final)
+        if final:
+            # Окончательный текст короче показанного (курсор на границе
+            # сообщения, замена ошибкой) — лишние продолжения убираем
+            for i in range(len(self._messages) - 1, len(parts) - 1, -1):
+                await self._drop(i)
+
+    async def _drop(self, i: int) -> None:
+        try:
+            await self._messages[i].delete()
+        except TelegramError as e:
+            logger.debug("Не удалось удалить продолжение ответа: %s", e)
+            await self._edit(i, "…", final=True)
+        del self._messages[i], self._shown[i]
+
+    async def _wait_turn(self, final: bool) -> None:
+        # Окончательный текст ждёт только паузы после 429, промежуточный — и интервала
+        wait = (self._retry_at if final else max(self._retry_at, self._next_edit)) - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def _edit(self, i: int, part: str, final: bool) -> None:
+        for _ in range(3 if final else 1):
+            await self._wait_turn(final)
+            try:
+                await self._messages[i].edit_text(part)
+                self._shown[i] = part
+                self.edits += 1
+                self._next_edit = time.monotonic() + self.interval
+                return
+            except RetryAfter as e:
+                logger.warning("Telegram 429 при правке ответа, пауза %s с", e.retry_after)
+                self._retry_at = time.monotonic() + float(e.retry_after)
+            except BadRequest as e:
+                # «message is not modified» и подобное — повтор не поможет
+                logger.debug("Правка ответа пропущена: %s", e)
+                self._shown[i] = part
+                return
+            except TelegramError as e:
+                logger.warning("Не удалось обновить ответ: %s", e)
+                return
+
+    async def _send(self, part: str, final: bool) -> None:
+        for _ in range(3 if final else 1):
+            await self._wait_turn(final)
+            try:
+                message = await self.reply_to.reply_text(part)
+            except RetryAfter as e:
+                self._retry_at = time.monotonic() + float(e.retry_after)
+                continue
+            except TelegramError as e:
+                logger.warning("Не удалось отправить продолжение ответа: %s", e)
+                return
+            self._messages.append(message)
+            self._shown.append(part)
+            self._next_edit = time.monotonic() + self.interval
+            return
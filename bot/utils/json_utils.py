@@ -1,13 +1,114 @@
 import os
 import json
+import asyncio
 import logging
-import aiofiles
+from typing import Any, Callable, Dict
+
+# Окно склейки записей одного файла, секунд
+JSON_SAVE_DELAY = float(os.getenv("JSON_SAVE_DELAY", "0.5"))
+
+
+def _key(path: str) -> str:
+    """Нормализованный путь: разные записи одного файла склеиваются."""
+    return os.path.abspath(path)
+
+
+def _write_atomic(path: str, data) -> None:
+    """
+    Сериализует data и атомарно подменяет файл: пишет во временный
+    файл рядом и делает os.replace. При падении посреди записи
+    на диске остаётся старая целая версия.
+    """
+    text = json.dumps(data, ensure_ascii=False, indent=2)
+    dir_name = os.path.dirname(path)
+    if dir_name and not os.path.exists(dir_name):
+        os.makedirs(dir_name, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class JsonWriter:
+    """
+    Отложенная запись JSON: сохранения одного файла в пределах окна
+    delay склеиваются в одну запись последней версии данных.
+    Сериализация и запись идут в рабочем потоке, файл подменяется атомарно.
+    Вместо JSON можно передать свою функцию записи dump(path, data).
+    """
+
+    def __init__(self, delay: float = JSON_SAVE_DELAY) -> None:
+        self.delay = delay
+        self._pending: Dict[str, Any] = {}
+        self._dumps: Dict[str, Callable[[str, Any], Any]] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._flush_now = asyncio.Event()
+
+    def pending(self, path: str):
+        """Данные, ожидающие записи в path, или None."""
+        return self._pending.get(_key(path))
+
+    def schedule(self, path: str, data, dump: Callable[[str, Any], Any] = _write_atomic) -> None:
+        """Ставит data на запись в path (более поздняя версия заменяет раннюю)."""
+        key = _key(path)
+        self._pending[key] = data
+        self._dumps[key] = dump
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.create_task(self._run(key))
+
+    async def _run(self, key: str) -> None:
+        """Пишет файл, пока для него есть новые данные."""
+        try:
+            while key in self._pending:
+                try:
+                    await asyncio.wait_for(self._flush_now.wait(), timeout=self.delay)
+                except asyncio.TimeoutError:
+                    pass
+                await self._write(key)
+        finally:
+            self._tasks.pop(key, None)
+
+    async def _write(self, key: str) -> None:
+        data = self._pending.pop(key, None)
+        if data is None:
+            return
+        try:
+            await asyncio.to_thread(self._dumps.get(key, _write_atomic), key, data)
+            logging.info(f"Успешно сохранён файл: {key}")
+        except RuntimeError:
+            # Данные изменились во время сериализации — запишем на следующем круге
+            self._pending.setdefault(key, data)
+        except Exception as e:
+            logging.error(f"Ошибка при сохранении JSON {key}: {e}")
+
+    def discard(self, path: str) -> None:
+        """Отменяет ещё не выполненную запись path."""
+        self._pending.pop(_key(path), None)
+
+    async def flush(self) -> None:
+        """Немедленно записывает всё, что ожидает записи."""
+        self._flush_now.set()
+        try:
+            while self._tasks:
+                await asyncio.gather(*list(self._tasks.values()), return_exceptions=True)
+        finally:
+            self._flush_now.clear()
+
+
+_writer = JsonWriter()
+
 
 def safe_load_json(path: str, default):
     """
     Синхронно загружает JSON-файл.
+    Если для файла есть ещё не записанные данные — возвращает их.
     Если файл не существует или повреждён — возвращает default и пишет ошибку в лог.
     """
+    pending = _writer.pending(path)
+    if pending is not None:
+        return pending
     if not os.path.exists(path):
         logging.warning(f"Файл {path} не найден, возвращаю default.")
         return default
@@ -20,17 +121,42 @@ def safe_load_json(path: str, default):
 
 async def async_save_json(path: str, data):
     """
-    Асинхронно сохраняет data в JSON-файл.
-    Если директория не существует — создаёт её.
+    Ставит data на отложенную запись в JSON-файл и сразу возвращается.
+    Несколько сохранений одного файла за JSON_SAVE_DELAY склеиваются в одну
+    атомарную запись. Если директория не существует — создаёт её.
     Ошибки пишет в лог, не выбрасывает.
     """
+    save_json_later(path, data)
+
+def save_json_later(path: str, data):
+    """
+    Синхронный вариант async_save_json для кода вне корутин.
+    Без запущенного цикла событий пишет файл сразу.
+    """
     try:
-        dir_name = os.path.dirname(path)
-        if dir_name and not os.path.exists(dir_name):
-            os.makedirs(dir_name, exist_ok=True)
-        async with aiofiles.open(path, "w", encoding="utf-8") as f:
-            await f.write(json.dumps(data, ensure_ascii=False, indent=2))
-        logging.info(f"Успешно сохранён JSON: {path}")
-    except Exception as e:
-        logging.error(f"Ошибка при сохранении JSON {path}: {e}")
+        asyncio.get_running_loop()
+    except RuntimeError:
+        _write_atomic(path, data)
+        return
+    _writer.schedule(path, data)
+
+async def async_save_file(path: str, data, dump: Callable[[str, Any], Any]):
+    """
+    То же, что async_save_json, но запись выполняет dump(path, data)
+    (например, бинарный снимок). dump должен писать атомарно.
+    """
+    _writer.schedule(path, data, dump)
 
+def cancel_pending_json(path: str):
+    """Отменяет отложенную запись path (например, перед удалением файла)."""
+    _writer.discard(path)
+
+def pending_save(path: str):
+    """Данные, ожидающие отложенной записи в path, или None."""
+    return _writer.pending(path)
+
+async def flush_pending_json():
+    """
+    Записывает все отложенные JSON-файлы. Вызывается при остановке приложения.
+    """
+    await _writer.flush()
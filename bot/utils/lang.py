@@ -1,13 +1,5 @@
 from telegram import InlineKeyboardMarkup, InlineKeyboardButton
-from utils.json_utils import safe_load_json
-import os
-
-# Путь к данным
-DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
-USER_JSON_PATH = os.path.join(DATA_DIR, "user_data.json")
-
-# Грузим user_data (если нужен live-режим — вынеси в функцию)
-user_data = safe_load_json(USER_JSON_PATH, {})
+from services.profile_store import profiles
 
 T = {
     "RU": {
@@ -16,8 +8,10 @@ T = {
         "male": "мужчина", "female": "женщина", "skip": "Не указывать",
         "lang_set": "Язык установлен ✅", "welcome": "👋 Привет! Я Bro 24/7 — всегда на связи.",
         "rem_fmt": "Формат: 'через 10мин ...' / 'через 2 часа ...'", "rem_bad": "Не понял формат.",
-        "rem_save": "⏰ Напомню через {d}: {m}", "style_ok": "Стиль сохранён ✅", "cleared": "🧹 Очищено.",
-        "err": "Ошибка. Попробуй ещё или /start.",
+        "rem_save": "⏰ Напомню через {d}: {m}", "rem_repeat": "🔁 Буду напоминать ({r}), первый раз {d}: {m}", "style_ok": "Стиль сохранён ✅", "cleared": "🧹 Очищено.",
+        "err": "Ошибка. Попробуй ещё или /start.", "thinking": "✍️ Пишу…",
+        "reminder_alert": "⏰ Напоминание: {m}",
+        "reminder_digest": "⏰ Напоминания ({n}):\n{items}", "reminder_digest_item": "• {t} {m}",
         "choose_style": "Выбери стиль общения:",
         "style_street": "🔥 Уличный бро",
         "style_psych": "🧘 Психолог",
@@ -29,8 +23,10 @@ T = {
         "male": "male", "female": "female", "skip": "Skip",
         "lang_set": "Language set ✅", "welcome": "👋 Hey! I'm Bro 24/7 — always online.",
         "rem_fmt": "Format: 'in 10min ...' / 'in 2 hours ...'", "rem_bad": "Bad format.",
-        "rem_save": "⏰ I'll remind you in {d}: {m}", "style_ok": "Style saved ✅", "cleared": "🧹 Cleared.",
-        "err": "Error. Try again or /start.",
+        "rem_save": "⏰ I'll remind you in {d}: {m}", "rem_repeat": "🔁 I'll remind you ({r}), first on {d}: {m}", "style_ok": "Style saved ✅", "cleared": "🧹 Cleared.",
+        "err": "Error. Try again or /start.", "thinking": "✍️ Typing…",
+        "reminder_alert": "⏰ Reminder: {m}",
+        "reminder_digest": "⏰ Reminders ({n}):\n{items}", "reminder_digest_item": "• {t} {m}",
         "choose_style": "Choose your style:",
         "style_street": "🔥 Street bro",
         "style_psych": "🧘 Psychologist",
@@ -40,7 +36,7 @@ T = {
 
 def get_lang(uid: int) -> str:
     """Вернуть код языка пользователя, default RU"""
-    return user_data.get(str(uid), {}).get("language", "RU")
+    return profiles.get(uid).get("language", "RU")
 
 def get_keyboard(lang_code: str):
     """Собрать главную клавиатуру для выбранного языка"""
@@ -51,8 +47,7 @@ def get_keyboard(lang_code: str):
         [InlineKeyboardButton(t["prof"], callback_data="prof"), InlineKeyboardButton(t["clr"], callback_data="clear")],
     ])
 
-# Для будущего — если потребуется обновлять user_data на лету
+# Перечитать профили с диска (например, после ручной правки файла)
 def reload_user_data():
-    global user_data
-    user_data = safe_load_json(USER_JSON_PATH, {})
+    profiles.reload()
 
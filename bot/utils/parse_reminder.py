@@ -1,58 +1,166 @@
+"""
+Разбор напоминаний из текста сообщения.
+
+on_text вызывает разбор (parse_reminder) на каждом сообщении, а
+напоминаний среди них единицы. Поэтому сначала идёт дешёвый фильтр по
+первому символу (большая часть текста отсеивается без регулярных
+выражений), затем одна попытка сопоставления с общей грамматикой
+(_GRAMMAR) для разовых и повторяющихся напоминаний на русском и
+английском; её якорные ветки отбрасывают прочее на первом слове.
+Абсолютное время трактуется в поясе REMINDER_TZ и возвращается aware.
+"""
 import re
 import datetime
-from typing import Tuple
-
-# RU
-R_MIN_RU = re.compile(r"через\s+(\d+)\s*мин(?:ут[ыу]?)?\s+(.*)", re.I)
-R_HR_RU = re.compile(r"через\s+(\d+)\s*час(?:а|ов)?\s+(.*)", re.I)
-# EN
-R_MIN_EN = re.compile(r"in\s+(\d+)\s*min(?:s|utes)?\s+(.*)", re.I)
-R_HR_EN = re.compile(r"in\s+(\d+)\s*hour(?:s)?\s+(.*)", re.I)
-# DateTime универсально (21.07.2025 18:00 или 21/07/2025 18:00)
-R_DATE_TIME = re.compile(r"(\d{2})[./](\d{2})[./](\d{4})\s+(\d{2}):(\d{2})\s+(.*)")
-
-def parse_delay(text: str, lang: str) -> Tuple[int | datetime.datetime, str] | None:
+from typing import Optional, Tuple, Union
+from zoneinfo import ZoneInfo
+
+from services.recurrence import REMINDER_TZ, RecurrenceRule, WEEKDAYS, parse_rule
+
+# Слова, с которых начинаются напоминания (кроме дат — они с цифры)
+_LEADS = (
+    "через", "in", "сегодня", "завтра", "послезавтра", "today", "tomorrow",
+    "каждый", "каждые", "каждую", "каждое", "ежедневно", "every", "daily", "cron",
+)
+# Первые символы напоминаний в обоих регистрах (плюс цифры и пробелы перед strip)
+_LEAD_CHARS = frozenset("".join(w[0] + w[0].upper() for w in _LEADS) + "0123456789 \t\n")
+
+# Единицы относительного времени -> минуты
+_UNITS = (
+    (r"мин(?:ута|уты|уту|ут)?|min(?:s|ute|utes)?", 1),
+    (r"час(?:а|ов)?|h(?:ours?|rs?)?", 60),
+    (r"день|дня|дней|сутки|суток|days?", 24 * 60),
+    (r"недел(?:я|ю|и|ь)|weeks?", 7 * 24 * 60),
+)
+_DAY_OFFSETS = {"сегодня": 0, "today": 0, "завтра": 1, "tomorrow": 1, "послезавтра": 2}
+_WDAYS_RU = ("пон", "вто", "сре", "чет", "пят", "суб", "вос")
+
+_AT = r"\s+(?:(?:в|at)\s+)?"
+# После дня недели без предлога — только ЧЧ:ММ: «сегодня 3 раза ходил в зал»,
+# «today 5 people came» — обычный текст, а не напоминание
+_DAY_AT = r"\s+(?:(?:в|at)\s+|(?=\d{1,2}:\d{2}))"
+_HM = r"(?P<{0}h>\d{{1,2}})(?::(?P<{0}m>\d{{2}}))?"
+
+# Общая грамматика: одна попытка сопоставления вместо цепочки регулярок
+_GRAMMAR = re.compile(
+    r"(?:"
+    # через 10 минут / in 2 days; число обязательно: «через час буду дома»,
+    # «in a week we go» — обычный текст, а не напоминание
+    r"(?:через|in)\s+(?P<n>\d{1,6})\s*(?:"
+    + "|".join(f"(?P<u{i}>{unit})" for i, (unit, _) in enumerate(_UNITS))
+    + r")"
+    # завтра в 9 / tomorrow 18:00 / сегодня в 21:30
+    r"|(?P<day>сегодня|завтра|послезавтра|today|tomorrow)" + _DAY_AT + _HM.format("d")
+    # 21.07.2025 18:00 / 21/07 в 18:00
+    + r"|(?P<dd>\d{1,2})[./](?P<mo>\d{1,2})(?:[./](?P<y>\d{4}))?" + _AT + r"(?P<th>\d{1,2}):(?P<tm>\d{2})"
+    # cron 0 9 * * 1-5
+    r"|cron\s+(?P<cron>\S+\s+\S+\s+\S+\s+\S+\s+\S+)"
+    # каждый день в 9 / ежедневно в 21:30 / every day at 7 / daily at 7
+    r"|(?:каждый\s+день|ежедневно|every\s+day|daily)\s+(?:в|at)\s+" + _HM.format("r")
+    # каждый понедельник в 9:30 / every monday at 9:30
+    + r"|(?:кажд(?:ый|ую|ое)|every)\s+(?P<wd>пон|вто|сре|чет|пят|суб|вос|mon|tue|wed|thu|fri|sat|sun)\w*"
+    r"\s+(?:в|at)\s+" + _HM.format("w")
+    # каждые 2 часа / каждый час / every 30 minutes
+    + r"|(?P<every>кажд(?:ый|ые|ую)|every)\s+(?:(?P<en>\d{1,6})\s*)?(?:(?P<emin>мин|min)|час|hour)\w*"
+    r")(?:\s+(?P<msg>.*))?\Z",
+    re.I | re.S,
+)
+
+Delay = Union[datetime.timedelta, datetime.datetime]
+Parsed = Union[RecurrenceRule, datetime.timedelta, datetime.datetime]
+
+
+def parse_reminder(
+    text: str, lang: str, now: Optional[datetime.datetime] = None
+) -> Optional[Tuple[Parsed, str]]:
     """
-    Парсит напоминание:
-    - через 10мин ... / через 2 часа ... (RU)
-    - in 10min ... / in 2 hours ... (EN)
-    - 21.07.2025 18:00 ... (RU/EN)
-    Возвращает (минуты, текст) или (datetime, текст) либо None.
+    Разбирает сообщение как напоминание (RU и EN в любом языке интерфейса).
+
+    Разовые:
+    - через 10мин ... / через 2 часа ... / через 3 дня ... / через 1 неделю ...
+    - in 10min ... / in 2 hours ... / in 1 day ... / in 2 weeks ...
+    - завтра в 9 ... / послезавтра в 18:30 ... / tomorrow 18:00 ... / today at 21 ...
+      (без «в»/«at» время только в виде ЧЧ:ММ)
+      (уже прошедшее время сегодня — на следующий день)
+    - 21.07.2025 18:00 ... / 21.07 в 18:00 ... (без года — ближайшее такое число)
+    Повторяющиеся:
+    - каждый день в 9 ... / каждые 2 часа ... / каждый понедельник в 9:30 ...
+    - every day at 9 ... / every 2 hours ... / every monday at 9:30 ...
+    - cron 0 9 * * 1-5 ...
+
+    Возвращает (timedelta, текст) для относительного времени,
+    (aware datetime в поясе REMINDER_TZ, текст) для абсолютного,
+    (RecurrenceRule, текст) для повторяющегося либо None.
     """
-    # Пробуем дату (универсально для RU/EN)
-    m = R_DATE_TIME.match(text.strip())
-    if m:
-        try:
-            dt = datetime.datetime(int(m.group(3)), int(m.group(2)), int(m.group(1)), int(m.group(4)), int(m.group(5)))
-            msg = m.group(6).strip() or ("Без текста" if lang == "RU" else "No text")
-            return dt, msg
-        except Exception:
-            return None
-
-    # Интервалы по языку
-    if lang == "RU":
-        m = R_MIN_RU.match(text)
-        if m:
-            minutes = int(m.group(1))
-            msg = m.group(2).strip() or "Без текста"
-            return minutes, msg
-        m = R_HR_RU.match(text)
-        if m:
-            hours = int(m.group(1))
-            msg = m.group(2).strip() or "Без текста"
-            return hours * 60, msg
-    else:
-        m = R_MIN_EN.match(text)
-        if m:
-            minutes = int(m.group(1))
-            msg = m.group(2).strip() or "No text"
-            return minutes, msg
-        m = R_HR_EN.match(text)
-        if m:
-            hours = int(m.group(1))
-            msg = m.group(2).strip() or "No text"
-            return hours * 60, msg
-
-    # Если ничего не нашли
-    return None
+    if text[:1] not in _LEAD_CHARS:
+        return None
+    if text[:1].isspace():
+        text = text.lstrip()
+    m = _GRAMMAR.match(text)
+    if m is None:
+        return None
+    msg = (m.group("msg") or "").strip() or ("Без текста" if lang == "RU" else "No text")
+    try:
+        return _when(m, now), msg
+    except ValueError:
+        # 25:00, 31.02, некорректный cron и т.п.
+        return None
+
+
+def _when(m: re.Match, now: Optional[datetime.datetime]) -> Parsed:
+    for i, (_, minutes) in enumerate(_UNITS):
+        if m.group(f"u{i}"):
+            return datetime.timedelta(minutes=int(m.group("n")) * minutes)
+
+    # Правила повторения кешируются в parse_rule
+    if m.group("cron"):
+        return parse_rule(f"cron {m.group('cron')}")
+    if m.group("rh"):
+        return parse_rule(f"daily {int(m.group('rh'))}:{m.group('rm') or 0}")
+    if m.group("wd"):
+        wd = m.group("wd").lower()
+        day = WEEKDAYS[_WDAYS_RU.index(wd)] if wd in _WDAYS_RU else wd
+        return parse_rule(f"weekly {day} {int(m.group('wh'))}:{m.group('wm') or 0}")
+    if m.group("every"):
+        unit = 60 if m.group("emin") else 3600
+        return parse_rule(f"every {int(m.group('en') or 1) * unit}")
+
+    tz = ZoneInfo(REMINDER_TZ)
+    now = (now or datetime.datetime.now(datetime.timezone.utc)).astimezone(tz)
+    if m.group("day"):
+        day = now.date() + datetime.timedelta(days=_DAY_OFFSETS[m.group("day").lower()])
+        at = datetime.datetime.combine(day, datetime.time(int(m.group("dh")), int(m.group("dm") or 0)), tz)
+        # «сегодня в 9», отправленное после 9:00, — завтра в 9, как dd.mm без года
+        return at if at > now else at + datetime.timedelta(days=1)
+    year = int(m.group("y") or now.year)
+    at = datetime.datetime(year, int(m.group("mo")), int(m.group("dd")), int(m.group("th")), int(m.group("tm")), tzinfo=tz)
+    if not m.group("y") and at <= now:
+        at = at.replace(year=year + 1)
+    return at
+
+
+def parse_delay(
+    text: str, lang: str, now: Optional[datetime.datetime] = None
+) -> Optional[Tuple[Delay, str]]:
+    """Только разовое напоминание: (timedelta | aware datetime, текст) или None."""
+    parsed = parse_reminder(text, lang, now)
+    if parsed is None or isinstance(parsed[0], RecurrenceRule):
+        return None
+    return parsed
+
+
+def parse_recurrence(text: str, lang: str) -> Optional[Tuple[RecurrenceRule, str]]:
+    """Только повторяющееся напоминание: (правило, текст) или None."""
+    parsed = parse_reminder(text, lang)
+    if parsed is None or not isinstance(parsed[0], RecurrenceRule):
+        return None
+    return parsed
+
 
+def format_delta(delta: datetime.timedelta, lang: str) -> str:
+    """Относительное время для подтверждения: «1 д 2 ч 30 мин» / «1 d 2 h 30 min»."""
+    minutes = int(delta.total_seconds() // 60)
+    days, minutes = divmod(minutes, 24 * 60)
+    hours, minutes = divmod(minutes, 60)
+    names = ("д", "ч", "мин") if lang == "RU" else ("d", "h", "min")
+    parts = [f"{v} {n}" for v, n in zip((days, hours, minutes), names) if v]
+    return " ".join(parts) or f"0 {names[2]}"
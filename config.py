@@ -1,9 +1,7 @@
 import os
 import logging
-from dotenv import load_dotenv
 
-# Загружаем .env
-load_dotenv()
+# Переменные окружения (.env) загружает main.py при старте
 
 # Строго требуемые переменные
 REQUIRED_VARS = [
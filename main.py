@@ -1,49 +1,201 @@
 import os
+import sys
+import time
+import logging
+from pathlib import Path
 from dotenv import load_dotenv
 import asyncio
-from fastapi import FastAPI, Request
-from telegram import Update
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
 
-from bot.bot import create_bot
+# Модули бота импортируют друг друга от каталога bot/ (services.*, utils.*,
+# handlers.*): добавляем его в sys.path один раз и импортируем всё от этого
+# корня — иначе bot.services.x и services.x были бы разными модулями со своим
+# состоянием. В конец, чтобы имя bot по-прежнему было пакетом, а не bot/bot.py
+BOT_DIR = Path(__file__).resolve().parent / "bot"
+if str(BOT_DIR) not in sys.path:
+    sys.path.append(str(BOT_DIR))
 
+from services.ingress import UpdateDeduplicator, WebhookIngress
+from utils.json_utils import flush_pending_json
 
-# Загрузка переменных окружения
+
+# Загрузка переменных окружения (единственное место, где читается .env)
 load_dotenv()
 WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+# Размер очереди webhook и политика при переполнении (shed | 429 | block)
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+WEBHOOK_OVERLOAD_POLICY = os.getenv("WEBHOOK_OVERLOAD_POLICY", "429")
+# Сколько последних update_id помнить для отсева повторных доставок
+WEBHOOK_DEDUP_SIZE = int(os.getenv("WEBHOOK_DEDUP_SIZE", "10000"))
+# Число параллельных полос обработки и размер очереди каждой полосы
+UPDATE_LANES = int(os.getenv("UPDATE_LANES", "8"))
+UPDATE_LANE_SIZE = int(os.getenv("UPDATE_LANE_SIZE", "100"))
+
+logger = logging.getLogger(__name__)
 
 # Глобальный объект приложения Telegram
 application = None
+# Параллельная обработка апдейтов по полосам пользователей
+dispatcher = None
+# Фоновая задача запуска и тайминги её фаз (мс)
+boot_task = None
+startup_timings = {}
+ready = False
+
+
+async def _process_update(data: dict) -> None:
+    """
+    Превращает JSON апдейта в Update и ставит его в полосу пользователя.
+    """
+    from telegram import Update
+
+    update = Update.de_json(data, application.bot)
+    await dispatcher.submit(update)
+
+
+# Входная очередь webhook: принимает апдейты ещё до готовности бота,
+# разбирать её начинаем после запуска Application
+ingress = WebhookIngress(
+    _process_update,
+    maxsize=WEBHOOK_QUEUE_SIZE,
+    policy=WEBHOOK_OVERLOAD_POLICY,
+    dedup=UpdateDeduplicator(WEBHOOK_DEDUP_SIZE),
+)
 
 # Инициализация FastAPI
 app = FastAPI()
 
-@app.on_event("startup")
-async def on_startup():
+
+async def _boot():
     """
-    Создаёт Telegram Application, инициализирует его,
-    запускает и устанавливает webhook.
+    Создаёт Telegram Application, инициализирует его, запускает
+    и при необходимости устанавливает webhook. Длительность каждой
+    фазы записывается в startup_timings.
     """
-    global application
+    global application, dispatcher, ready
+    started = time.perf_counter()
+    phase_started = started
+
+    def phase(name: str) -> None:
+        nonlocal phase_started
+        now = time.perf_counter()
+        startup_timings[name] = round((now - phase_started) * 1000, 1)
+        phase_started = now
+
+    # Тяжёлые импорты (telegram и хендлеры) — только здесь, не при импорте main
+    from bot.bot import create_bot
+    from services.dispatcher import ShardedDispatcher
+    phase("import")
+
     application = await create_bot()
+    phase("create_bot")
     # Инициализация и запуск приложения
     await application.initialize()
+    phase("initialize")
     await application.start()
-    # Установка webhook
-    await application.bot.set_webhook(url=WEBHOOK_URL)
+    # Апдейты разных пользователей обрабатываются параллельно, одного — по порядку
+    dispatcher = ShardedDispatcher(
+        application.process_update,
+        lanes=UPDATE_LANES,
+        lane_size=UPDATE_LANE_SIZE,
+    )
+    dispatcher.start()
+    ingress.start()
+    phase("start")
+
+    # Webhook ставим только если адрес изменился
+    info = await application.bot.get_webhook_info()
+    if info.url != WEBHOOK_URL:
+        await application.bot.set_webhook(url=WEBHOOK_URL)
+        logger.info("Webhook установлен: %s", WEBHOOK_URL)
+    phase("webhook")
+
+    startup_timings["total"] = round((time.perf_counter() - started) * 1000, 1)
+    ready = True
+    logger.info("Бот готов, фазы запуска (мс): %s", startup_timings)
+
+
+@app.on_event("startup")
+async def on_startup():
+    """
+    Запускает инициализацию бота в фоне, чтобы сервер сразу начал
+    принимать запросы. Готовность — на /ready.
+    """
+    global boot_task
+    boot_task = asyncio.create_task(_boot())
+    boot_task.add_done_callback(_log_boot_failure)
+
+
+def _log_boot_failure(task: asyncio.Task) -> None:
+    """Пишет в лог ошибку фонового запуска (иначе она видна только на /ready)."""
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Ошибка запуска бота", exc_info=task.exception())
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    """
+    Дожидается разбора очереди webhook, останавливает приложение и
+    планировщик напоминаний (отдаёт аренды), закрывает соединения
+    OpenAI и дописывает отложенные JSON-файлы.
+    """
+    try:
+        if boot_task is not None and not boot_task.done():
+            boot_task.cancel()
+        await ingress.stop()
+        if dispatcher is not None:
+            await dispatcher.stop()
+        if application is not None and application.running:
+            await application.stop()
+            # Напоминания: после остановки job_queue, пока бот ещё может отправлять
+            from services.reminder_scheduler import shutdown as stop_reminders
+
+            try:
+                await stop_reminders(application)
+            finally:
+                await application.shutdown()
+        # Пул соединений клиента OpenAI (создаётся при первом запросе к чату)
+        from services.openai_service import close_client
+
+        await close_client()
+    finally:
+        # Последним шагом, даже если остановка выше упала: профили и истории
+        # пишутся через utils.json_utils с задержкой
+        await flush_pending_json()
+
 
 @app.post("/webhook")
 async def webhook(request: Request):
     """
     Обрабатывает входящие запросы от Telegram по webhook.
-    Парсит Update и добавляет в очередь обработки.
-    """
-    global application
-    if application is None:
-        return {"error": "Application not initialized"}
-    # Получаем JSON тела запроса
-    data = await request.json()
-    # Создаём объект Update
-    update = Update.de_json(data, application.bot)
-    # Добавляем в очередь обновлений
-    await application.update_queue.put(update)
+    Кладёт тело запроса в ограниченную очередь и сразу отвечает
+    (в том числе пока бот ещё запускается).
+    """
+    status = await ingress.ingest(await request.body())
+    if status != 200:
+        return Response(status_code=status)
     return {"ok": True}
+
+
+@app.get("/webhook/stats")
+async def webhook_stats():
+    """
+    Метрики входной очереди и полос обработки.
+    """
+    stats = ingress.stats()
+    if dispatcher is not None:
+        stats["dispatcher"] = dispatcher.stats()
+    return stats
+
+
+@app.get("/ready")
+async def readiness():
+    """
+    Готовность к обработке: 200 после запуска бота, иначе 503.
+    В ответе — тайминги фаз запуска и ошибка, если запуск упал.
+    """
+    body = {"ready": ready, "startup_ms": startup_timings}
+    if boot_task is not None and boot_task.done() and not boot_task.cancelled() and boot_task.exception():
+        body["error"] = repr(boot_task.exception())
+    return JSONResponse(body, status_code=200 if ready else 503)